@@ -15,8 +15,11 @@ app.secret_key = os.environ.get("SESSION_SECRET", "super-secret-key")
 # Configure app settings from config.py
 app.config.from_pyfile('config.py')
 
-# Initialize Socket.IO for real-time communication
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Initialize Socket.IO for real-time communication. SOCKETIO_ASYNC_MODE
+# ('eventlet', 'gevent' or 'threading', set by wsgi.py) picks the server;
+# unset, Flask-SocketIO uses the first one installed
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    async_mode=os.environ.get("SOCKETIO_ASYNC_MODE") or None)
 
 # Import routes to register blueprints
 from routes.dashboard import dashboard_bp
@@ -29,8 +29,11 @@ class VectorSearchService:
         self.index_path = index_path or os.path.join(FAISS_INDEX_DIR, 'faiss_index.bin')
         self.id_mapping_path = os.path.join(FAISS_INDEX_DIR, 'id_mapping.json')
         self.index = self._load_or_create_index()
-        self.id_to_index = self._load_id_mapping()
-        self.index_to_id = {v: k for k, v in self.id_to_index.items()}
+        
+        # Indexes saved before chunk IDs were stored in the index address
+        # vectors by position through a separate mapping file
+        if not isinstance(self.index, faiss.IndexIDMap2):
+            self._migrate_to_id_map()
         
         # Create directory if it doesn't exist
         os.makedirs(FAISS_INDEX_DIR, exist_ok=True)
@@ -52,11 +55,32 @@ class VectorSearchService:
     def _create_new_index(self):
         """Create a new FAISS index"""
         logger.info(f"Creating new FAISS index with dimension {self.dimension}")
-        index = faiss.IndexFlatL2(self.dimension)  # Simple L2 distance index
+        # Simple L2 distance index, storing each vector under its chunk ID so
+        # vectors can be removed in place
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension))
         return index
     
+    def _migrate_to_id_map(self):
+        """Move the vectors of a positional index under their chunk IDs"""
+        legacy_index = self.index
+        if legacy_index.d != self.dimension:
+            logger.error(f"Cannot migrate FAISS index with dimension {legacy_index.d}, expected {self.dimension}")
+            return
+        index_to_id = {v: k for k, v in self._load_id_mapping().items()}
+        
+        self.index = self._create_new_index()
+        if legacy_index.ntotal > 0:
+            all_vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+            positions = np.array(sorted(i for i in index_to_id if i < legacy_index.ntotal), dtype=np.int64)
+            if len(positions):
+                ids = np.array([index_to_id[i] for i in positions.tolist()], dtype=np.int64)
+                self.index.add_with_ids(np.ascontiguousarray(all_vectors[positions]), ids)
+        
+        self._save_index()
+        logger.info(f"Migrated FAISS index to IndexIDMap2 with {self.index.ntotal} vectors")
+    
     def _load_id_mapping(self):
-        """Load ID mapping from disk"""
+        """Load the legacy chunk ID -> position mapping from disk"""
         if os.path.exists(self.id_mapping_path):
             try:
                 with open(self.id_mapping_path, 'r') as f:
@@ -66,15 +90,6 @@ class VectorSearchService:
                 return {}
         return {}
     
-    def _save_id_mapping(self):
-        """Save ID mapping to disk"""
-        try:
-            with open(self.id_mapping_path, 'w') as f:
-                json.dump({str(k): v for k, v in self.id_to_index.items()}, f)
-            logger.info(f"Saved ID mapping to {self.id_mapping_path}")
-        except Exception as e:
-            logger.error(f"Error saving ID mapping: {e}")
-    
     def _save_index(self):
         """Save index to disk"""
         try:
@@ -85,30 +100,23 @@ class VectorSearchService:
     
     def add_vectors(self, ids: List[int], vectors: List[List[float]]):
         """Add vectors to the index"""
-        if not ids or not vectors or len(ids) != len(vectors):
+        if not ids or vectors is None or len(ids) != len(vectors):
             logger.error("Invalid input: ids and vectors must be non-empty and of the same length")
             return False
         
-        # Convert to numpy array and ensure float32 type
-        vectors_np = np.array(vectors).astype('float32')
-        
-        # Get current index size
-        current_size = self.index.ntotal
+        # Convert to a contiguous float32 array (no copy if it already is one)
+        vectors_np = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids_np = np.array(ids, dtype=np.int64)
         
         # Add vectors to index
         try:
-            self.index.add(vectors_np)
+            # Re-adding an ID replaces its vector
+            self.index.remove_ids(faiss.IDSelectorBatch(ids_np))
+            self.index.add_with_ids(vectors_np, ids_np)
             logger.info(f"Added {len(vectors_np)} vectors to FAISS index")
             
-            # Update mapping
-            for i, id_val in enumerate(ids):
-                idx = current_size + i
-                self.id_to_index[id_val] = idx
-                self.index_to_id[idx] = id_val
-            
-            # Save index and mapping
+            # Save index
             self._save_index()
-            self._save_id_mapping()
             
             return True
         except Exception as e:
@@ -121,21 +129,19 @@ class VectorSearchService:
             logger.warning("FAISS index is empty")
             return []
         
-        # Convert to numpy array and ensure float32 type
-        query_np = np.array([query_vector]).astype('float32')
+        # Convert to a contiguous float32 row (no copy if it already is one)
+        query_np = np.ascontiguousarray(query_vector, dtype=np.float32).reshape(1, -1)
         
         # Search index
         try:
             distances, indices = self.index.search(query_np, top_k)
             
-            # Map indices to IDs
+            # The index returns chunk IDs directly
             results = []
-            for i, idx in enumerate(indices[0]):
-                if idx != -1:  # -1 means no result
-                    chunk_id = self.index_to_id.get(idx)
-                    if chunk_id is not None:
-                        distance = distances[0][i]
-                        results.append((chunk_id, float(distance)))
+            for i, chunk_id in enumerate(indices[0]):
+                if chunk_id != -1:  # -1 means no result
+                    distance = distances[0][i]
+                    results.append((int(chunk_id), float(distance)))
             
             return results
         except Exception as e:
@@ -147,52 +153,15 @@ class VectorSearchService:
         if not ids:
             return True
         
-        # FAISS doesn't support direct deletion for flat indices
-        # We need to rebuild the index without the deleted vectors
-        
-        # Get indices to remove
-        indices_to_remove = set()
-        for id_val in ids:
-            if id_val in self.id_to_index:
-                indices_to_remove.add(self.id_to_index[id_val])
-        
-        if not indices_to_remove:
+        # Remove in place by chunk ID
+        removed = self.index.remove_ids(faiss.IDSelectorBatch(np.array(ids, dtype=np.int64)))
+        if not removed:
             return True
         
-        # Create a new index
-        new_index = self._create_new_index()
-        new_id_to_index = {}
-        new_index_to_id = {}
-        
-        # Only needed if we have vectors
-        if self.index.ntotal > 0:
-            # Get all vectors
-            all_vectors = np.zeros((self.index.ntotal, self.dimension), dtype='float32')
-            for i in range(self.index.ntotal):
-                if i not in indices_to_remove:
-                    # Get the original ID
-                    original_id = self.index_to_id.get(i)
-                    if original_id is not None:
-                        # Get the vector
-                        vector = np.zeros((1, self.dimension), dtype='float32')
-                        self.index.reconstruct(i, vector[0])
-                        
-                        # Add to new index
-                        new_index.add(vector)
-                        new_idx = new_index.ntotal - 1
-                        new_id_to_index[original_id] = new_idx
-                        new_index_to_id[new_idx] = original_id
-        
-        # Replace old index and mappings
-        self.index = new_index
-        self.id_to_index = new_id_to_index
-        self.index_to_id = new_index_to_id
-        
-        # Save index and mapping
+        # Save index
         self._save_index()
-        self._save_id_mapping()
         
-        logger.info(f"Deleted {len(indices_to_remove)} vectors from FAISS index")
+        logger.info(f"Deleted {removed} vectors from FAISS index")
         return True
     
     def get_stats(self):
@@ -267,8 +236,8 @@ class ApplicationService:
         # Generate a random vector with the specified dimension
         vector = np.random.randn(FAISS_DIMENSION).astype('float32')
         
-        # Normalize to unit length
-        vector = vector / np.linalg.norm(vector)
+        # Normalize to unit length in place
+        vector /= np.linalg.norm(vector)
         
         return vector.tolist()
     
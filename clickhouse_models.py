@@ -572,28 +572,67 @@ class LLMPrompt(BaseModel):
     @classmethod
     def create(cls, prompt: str, response: str, metadata: Dict = None, user_id: str = None) -> str:
         """Create a new LLM prompt record"""
-        prompt_id = str(uuid.uuid4())
-        metadata_str = json.dumps(metadata) if metadata else '{}'
+        prompt_ids = cls.bulk_create([{
+            'id': str(uuid.uuid4()),
+            'prompt': prompt,
+            'response': response,
+            'metadata': metadata,
+            'user_id': user_id
+        }])
+        return prompt_ids[0] if prompt_ids else None
+    
+    @classmethod
+    def bulk_create(cls, records: List[Dict]) -> List[str]:
+        """
+        Create multiple LLM prompt records in a single insert
         
-        query = f"""
-        INSERT INTO {cls.table_name} (id, prompt, response, metadata, user_id, response_time)
-        VALUES (%s, %s, %s, %s, %s, %s)
+        Records sharing an 'id' (e.g. a retried write) are merged before
+        sending, keeping the first, and rows are sorted by id to match the
+        table's ORDER BY key.
         """
+        if not records:
+            return []
         
-        # Calculate response time if metadata exists and has start/end time
-        response_time = 0.0
-        if metadata and 'start_time' in metadata and 'end_time' in metadata:
-            response_time = metadata['end_time'] - metadata['start_time']
+        # Pre-merge repeated writes of the same prompt so one row is sent
+        pending = {}
+        for record in records:
+            prompt_id = record.get('id') or str(uuid.uuid4())
+            pending.setdefault(prompt_id, record)
+        
+        bulk_data = []
+        for prompt_id in sorted(pending):
+            record = pending[prompt_id]
+            metadata = record.get('metadata')
+            bulk_data.append((
+                prompt_id,
+                record.get('prompt', ''),
+                record.get('response', ''),
+                json.dumps(metadata) if metadata else '{}',
+                record.get('user_id') or '',
+                cls._response_time(metadata)
+            ))
         
-        params = (prompt_id, prompt, response, metadata_str, user_id or '', response_time)
+        query = f"""
+        INSERT INTO {cls.table_name} (id, prompt, response, metadata, user_id, response_time)
+        VALUES
+        """
         
         try:
-            cls.execute(query, params)
-            logger.info(f"LLM prompt saved with ID: {prompt_id}")
-            return prompt_id
+            cls.execute(query, bulk_data)
+            logger.info(f"Saved {len(bulk_data)} LLM prompts ({len(records)} records received)")
+            return [row[0] for row in bulk_data]
         except Exception as e:
-            logger.error(f"Error saving LLM prompt: {e}")
-            return None
+            logger.error(f"Error saving LLM prompts: {e}")
+            return []
+    
+    @staticmethod
+    def _response_time(metadata: Dict = None) -> float:
+        """Get the measured response time, or derive it from the start/end time"""
+        if metadata and 'response_time' in metadata:
+            return float(metadata['response_time'])
+        if metadata and 'start_time' in metadata and 'end_time' in metadata:
+            return metadata['end_time'] - metadata['start_time']
+        return 0.0
     
     @classmethod
     def get_recent(cls, limit: int = 10) -> List[Dict]:
@@ -10,10 +10,13 @@ The vector operations are handled separately by FAISS.
 """
 
 import os
+import atexit
 import json
 import uuid
+import hashlib
 import logging
 import time
+import weakref
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
@@ -31,6 +34,27 @@ CLICKHOUSE_CONFIG = {
     'connect_timeout': 10
 }
 
+# Indexes that need training (IVF, PQ) hold vectors in an IndexFlatIP until
+# this many (and at least 39 per IVF list) have been added, then are trained
+# on them
+FAISS_TRAIN_SIZE = 10000
+
+# Short names accepted for index_type. SQ8 stores each dimension as one
+# byte, a quarter of the memory (and memory bandwidth) of float32.
+FAISS_INDEX_TYPE_ALIASES = {
+    'SQ8': 'IVF512,SQ8',
+}
+
+# Bytes per code that GPU IVF-PQ indexes support
+GPU_IVFPQ_CODE_SIZES = {1, 2, 3, 4, 8, 12, 16, 20, 24, 28, 32, 40, 48, 56, 64, 96}
+
+# Added vectors are appended to a write-ahead log; the full index is only
+# rewritten once the log grows past this size, on flush() and at exit
+FAISS_WAL_MAX_BYTES = 64 * 1024 * 1024
+
+# Write-ahead log record header: start row, vector count, size of the IDs
+WAL_HEADER_SIZE = 24
+
 # Import here to allow for clear error messages
 try:
     from clickhouse_driver import Client
@@ -474,12 +498,35 @@ class ClickHouseService:
             logger.error(f"Error getting all webpages: {e}")
             return []
 
+def _close_if_alive(close_ref: weakref.WeakMethod):
+    """atexit handler: close a FaissVectorService unless it has been garbage collected"""
+    close = close_ref()
+    if close is not None:
+        close()
+
 # FAISS vector class for handling embeddings
 class FaissVectorService:
     """FAISS vector service for vector similarity search"""
     
-    def __init__(self, dimension=384, index_path=None):
-        """Initialize the FAISS vector service"""
+    def __init__(self, dimension=384, index_path=None, index_type="HNSW32,Flat", nprobe=16, use_gpu=False,
+                 use_mmap=True):
+        """
+        Initialize the FAISS vector service
+        
+        Args:
+            dimension: Vector dimension
+            index_path: Path of the saved index
+            index_type: faiss.index_factory description of the index, e.g.
+                "HNSW32,Flat" (sub-linear search), "IVF1024,PQ48" (compressed,
+                needs training), "SQ8" (8-bit codes, needs training) or
+                "Flat" (exact search)
+            nprobe: Number of inverted lists searched on IVF indexes
+            use_gpu: Search a copy of the index on GPU 0 (True) or on all
+                GPUs ("all"), when FAISS has GPU support and a GPU is present
+            use_mmap: Memory-map the saved index so it is paged in on demand
+                instead of read up front. A mapped index is read-only; the
+                first add reads it into memory.
+        """
         try:
             import faiss
             import numpy as np
@@ -487,14 +534,52 @@ class FaissVectorService:
             self.faiss = faiss
             self.np = np
             self.dimension = dimension
+            self.index_type = FAISS_INDEX_TYPE_ALIASES.get(index_type.upper(), index_type)
+            self.nprobe = nprobe
+            self.train_size = self._train_size()
             self.index_path = index_path or 'data/faiss_index.bin'
-            self.id_mapping_path = os.path.join(os.path.dirname(self.index_path), 'id_mapping.json')
+            self.id_mapping_path = os.path.join(os.path.dirname(self.index_path), 'id_mapping.npy')
+            self.legacy_id_mapping_path = os.path.join(os.path.dirname(self.index_path), 'id_mapping.json')
+            self.wal_path = os.path.splitext(self.index_path)[0] + '.wal'
             
             # Create data directory if it doesn't exist
             os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
             
+            # The CPU index stays the one that is trained and saved; adds are
+            # mirrored to the GPU copy
+            self.use_gpu = use_gpu
+            self.gpu_res = None
+            self.gpu_index = None
+            self.gpu_enabled = False
+            
+            self.use_mmap = use_mmap
+            self.index_mapped = False
+            
             # Load or create index
-            self.index, self.id_map = self._load_or_create_index()
+            # id_ids[row] is the external ID of the vector at that row of the index
+            self.index, self.id_ids = self._load_or_create_index()
+            
+            # Re-add vectors logged after the index was last saved, then
+            # fold them into the saved index
+            replayed, wal_size = self._replay_wal()
+            if len(self.id_ids) < self.index.ntotal:
+                # Pad with empty IDs so later rows stay aligned with the index
+                logger.error(f"No IDs for FAISS index rows {len(self.id_ids)} to {self.index.ntotal - 1}")
+                padding = self.np.full(self.index.ntotal - len(self.id_ids), '', dtype=str)
+                self.id_ids = self.np.concatenate([self.id_ids, padding])
+            if os.path.exists(self.wal_path) and os.path.getsize(self.wal_path) != wal_size:
+                # Drop a torn or unusable tail, so new records aren't
+                # appended after bytes that would stop the next replay
+                os.truncate(self.wal_path, wal_size)
+            self.wal = open(self.wal_path, 'ab')
+            if replayed:
+                self.flush()
+            # Save on exit. The handler holds the service weakly, so it
+            # doesn't keep every instance alive until the process exits.
+            atexit.register(_close_if_alive, weakref.WeakMethod(self.close))
+            
+            if use_gpu:
+                self._init_gpu()
             
             logger.info(f"FAISS initialized with dimension {dimension}")
         except ImportError as e:
@@ -508,115 +593,392 @@ class FaissVectorService:
             # Try to load existing index
             if os.path.exists(self.index_path):
                 logger.info(f"Loading FAISS index from {self.index_path}")
-                index = self.faiss.read_index(self.index_path)
-                id_map = self._load_id_mapping()
+                if self.use_mmap:
+                    index = self._read_index_mmap()
+                else:
+                    index = self.faiss.read_index(self.index_path)
+                self._apply_nprobe(index)
+                id_ids = self._load_id_mapping()
+                if len(id_ids) > index.ntotal:
+                    # Saved mapping is ahead of the index (a save was cut
+                    # short); the write-ahead log re-adds the missing rows
+                    logger.warning(f"ID mapping has {len(id_ids)} entries but the FAISS index has "
+                                   f"{index.ntotal} vectors, recovering from the write-ahead log")
+                    id_ids = id_ids[:index.ntotal]
                 logger.info(f"FAISS index loaded with {index.ntotal} vectors")
-                return index, id_map
+                return index, id_ids
         except Exception as e:
             logger.warning(f"Error loading index, creating a new one: {e}")
         
         # Create a new index
         return self._create_new_index()
     
+    def _read_index_mmap(self):
+        """Memory-map the saved index, falling back to reading it into memory"""
+        read_only_mmap = self.faiss.IO_FLAG_MMAP | self.faiss.IO_FLAG_READ_ONLY
+        flag_sets = [read_only_mmap]
+        if hasattr(self.faiss, 'IO_FLAG_MMAP_IFC'):
+            # Newer FAISS can also map flat vector storage (flat and HNSW
+            # indexes); IVF lists only map with the plain flags
+            flag_sets.insert(0, read_only_mmap | self.faiss.IO_FLAG_MMAP_IFC)
+        
+        for flags in flag_sets:
+            try:
+                index = self.faiss.read_index(self.index_path, flags)
+                self.index_mapped = True
+                logger.info(f"Memory-mapped FAISS index from {self.index_path}")
+                return index
+            except RuntimeError as e:
+                logger.debug(f"Could not memory-map FAISS index with flags {flags:#x}: {e}")
+        
+        logger.info(f"{self.index_path} can't be memory-mapped, reading it into memory")
+        return self.faiss.read_index(self.index_path)
+    
+    def _ensure_writable(self):
+        """Replace a memory-mapped index with an in-memory copy that can be added to"""
+        if not self.index_mapped:
+            return
+        
+        # Nothing has been written to the mapped index, so the file on
+        # disk still matches it
+        self.index = self.faiss.read_index(self.index_path)
+        self._apply_nprobe(self.index)
+        self.index_mapped = False
+        logger.info(f"Read memory-mapped FAISS index into memory for writing ({self.index.ntotal} vectors)")
+        if self.gpu_enabled:
+            self._refresh_gpu_index()
+    
     def _create_new_index(self):
         """Create a new FAISS index"""
-        logger.info("Creating new FAISS index")
-        index = self.faiss.IndexFlatL2(self.dimension)
-        id_map = {}
-        return index, id_map
+        logger.info(f"Creating new FAISS index ({self.index_type})")
+        index = self._build_index()
+        if not index.is_trained:
+            # Can't add to it before training; start flat (see _maybe_train)
+            index = self.faiss.IndexFlatIP(self.dimension)
+        id_ids = self.np.empty(0, dtype=str)
+        return index, id_ids
+    
+    def _build_index(self):
+        """Build an empty index of the configured type
+        
+        Vectors are normalized to unit length, so inner product gives the
+        cosine similarity without the per-vector sqrt of L2 distance.
+        """
+        try:
+            index = self.faiss.index_factory(self.dimension, self.index_type, self.faiss.METRIC_INNER_PRODUCT)
+        except RuntimeError as e:
+            logger.warning(f"Invalid FAISS index type {self.index_type}, using IndexFlatIP: {e}")
+            self.index_type = "Flat"
+            index = self.faiss.IndexFlatIP(self.dimension)
+        self._apply_nprobe(index)
+        return index
+    
+    def _train_size(self):
+        """Number of vectors to collect before moving to the configured index type"""
+        ivf_index = self.faiss.try_extract_index_ivf(self._build_index())
+        if ivf_index is None:
+            return FAISS_TRAIN_SIZE
+        # FAISS wants at least 39 training vectors per inverted list
+        return max(FAISS_TRAIN_SIZE, 39 * ivf_index.nlist)
+    
+    def _apply_nprobe(self, index):
+        """Set the number of inverted lists searched if the index is an IVF index"""
+        ivf_index = self.faiss.try_extract_index_ivf(index)
+        if ivf_index is not None:
+            ivf_index.nprobe = self.nprobe
+    
+    def _maybe_train(self):
+        """Move the vectors of a flat index into the configured index type
+        once there are enough of them to train it on"""
+        if (self.index_type == "Flat" or not isinstance(self.index, self.faiss.IndexFlat)
+                or self.index.ntotal < self.train_size):
+            return
+        
+        index = self._build_index()
+        
+        # Vectors keep their positions, so the ID mapping stays valid
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        # Indexes saved before the switch to inner product may hold
+        # vectors that were never normalized
+        self.faiss.normalize_L2(vectors)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        logger.info(f"Moved {index.ntotal} vectors from {type(self.index).__name__} to {type(index).__name__}")
+        self.index = index
+    
+    def _init_gpu(self):
+        """Set up GPU resources and copy the index to the GPU"""
+        if not hasattr(self.faiss, 'StandardGpuResources') or self.faiss.get_num_gpus() == 0:
+            logger.warning("GPU requested but FAISS has no GPU support or no GPU was found, searching on CPU")
+            return
+        
+        if self.use_gpu != "all":
+            self.gpu_res = self.faiss.StandardGpuResources()
+            self.gpu_res.setTempMemory(512 << 20)
+        self.gpu_enabled = True
+        self._refresh_gpu_index()
+    
+    def _refresh_gpu_index(self):
+        """Replace the GPU copy of the index, or drop it if the index can't run on GPU"""
+        self.gpu_index = None
+        
+        ivf_index = self.faiss.try_extract_index_ivf(self.index)
+        if ivf_index is not None:
+            ivf_index = self.faiss.downcast_index(ivf_index)
+            if isinstance(ivf_index, self.faiss.IndexIVFPQ) and ivf_index.pq.M not in GPU_IVFPQ_CODE_SIZES:
+                logger.warning(f"IVF-PQ code size {ivf_index.pq.M} is not supported on GPU, searching on CPU")
+                return
+        
+        try:
+            if self.use_gpu == "all":
+                self.gpu_index = self.faiss.index_cpu_to_all_gpus(self.index)
+            else:
+                self.gpu_index = self.faiss.index_cpu_to_gpu(self.gpu_res, 0, self.index)
+            logger.info(f"Copied {type(self.index).__name__} with {self.index.ntotal} vectors to GPU")
+        except Exception as e:
+            logger.warning(f"Could not copy {type(self.index).__name__} to GPU, searching on CPU: {e}")
     
     def _load_id_mapping(self):
         """Load ID mapping from disk"""
-        if os.path.exists(self.id_mapping_path):
-            try:
-                with open(self.id_mapping_path, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.warning(f"Error loading ID mapping: {e}")
-        return {}
+        try:
+            if os.path.exists(self.id_mapping_path):
+                return self.np.load(self.id_mapping_path, allow_pickle=False)
+            if os.path.exists(self.legacy_id_mapping_path):
+                # Earlier versions saved a JSON object keyed by row number
+                with open(self.legacy_id_mapping_path, 'r') as f:
+                    id_map = json.load(f)
+                logger.info(f"Converting ID mapping from {self.legacy_id_mapping_path}")
+                return self.np.array([id_map[str(row)] for row in range(len(id_map))], dtype=str)
+        except Exception as e:
+            logger.warning(f"Error loading ID mapping: {e}")
+        return self.np.empty(0, dtype=str)
     
     def _save_id_mapping(self):
         """Save ID mapping to disk"""
         try:
-            with open(self.id_mapping_path, 'w') as f:
-                json.dump(self.id_map, f)
+            tmp_path = f"{self.id_mapping_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                self.np.save(f, self.id_ids)
+            os.replace(tmp_path, self.id_mapping_path)
+            return True
         except Exception as e:
             logger.error(f"Error saving ID mapping: {e}")
+            return False
     
     def _save_index(self):
         """Save index to disk"""
         try:
             logger.info(f"Saving FAISS index to {self.index_path}")
-            self.faiss.write_index(self.index, self.index_path)
-            self._save_id_mapping()
+            # Save the ID mapping first: if the index write is then cut
+            # short, loading trims the mapping back to the saved index and
+            # the write-ahead log restores the rest
+            if not self._save_id_mapping():
+                return False
+            # Write to a temporary file and swap it in, so a crash mid-write
+            # can't leave a truncated index behind
+            tmp_path = f"{self.index_path}.tmp"
+            self.faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+            return True
         except Exception as e:
             logger.error(f"Error saving index: {e}")
+            return False
+    
+    def flush(self):
+        """Write the index to disk and empty the write-ahead log"""
+        if self.wal.closed or self.wal.tell() == 0:
+            # Nothing added since the last save; rewriting a memory-mapped
+            # index would page all of it in for nothing
+            return
+        if self._save_index():
+            self.wal.seek(0)
+            self.wal.truncate()
+    
+    def close(self):
+        """Save pending changes and close the write-ahead log"""
+        if self.wal.closed:
+            return
+        self.flush()
+        self.wal.close()
     
-    def add_vectors(self, ids, vectors):
+    def _append_wal(self, start, ids, vectors_array):
+        """Log an added batch: header, IDs as JSON, then the raw float32 vectors"""
+        ids_bytes = json.dumps(ids).encode('utf-8')
+        header = self.np.array([start, len(ids), len(ids_bytes)], dtype='<i8')
+        self.wal.write(header.tobytes() + ids_bytes + self.np.ascontiguousarray(vectors_array, dtype='<f4').tobytes())
+        self.wal.flush()
+    
+    def _replay_wal(self):
+        """Add the vectors logged since the index was last saved, returning how
+        many and the size of the log up to the end of its last usable record"""
+        if not os.path.exists(self.wal_path):
+            return 0, 0
+        
+        with open(self.wal_path, 'rb') as f:
+            data = f.read()
+        
+        replayed = 0
+        offset = 0
+        while offset + WAL_HEADER_SIZE <= len(data):
+            start, count, ids_size = self.np.frombuffer(data, dtype='<i8', count=3, offset=offset).tolist()
+            ids_offset = offset + WAL_HEADER_SIZE
+            vectors_offset = ids_offset + ids_size
+            end = vectors_offset + count * self.dimension * 4
+            if min(start, count, ids_size) < 0 or end > len(data):
+                logger.warning("Ignoring incomplete record at the end of the FAISS write-ahead log")
+                break
+            
+            # Rows from before the last save are already mapped
+            mapped = len(self.id_ids)
+            if start + count > mapped:
+                if start > mapped:
+                    logger.warning(f"FAISS write-ahead log skips from row {mapped} to {start}, ignoring the rest")
+                    break
+                try:
+                    ids = json.loads(data[ids_offset:vectors_offset])
+                except ValueError:
+                    ids = None
+                if not isinstance(ids, list) or len(ids) != count:
+                    logger.warning("Ignoring corrupt record in the FAISS write-ahead log and the rest after it")
+                    break
+                vectors_array = self.np.frombuffer(data, dtype='<f4', count=count * self.dimension,
+                                                   offset=vectors_offset).reshape(count, self.dimension)
+                first = mapped - start
+                # Indexes saved before the ID mapping was written first can
+                # hold rows whose IDs were never saved; map those without
+                # adding their vectors again
+                indexed = min(self.index.ntotal - start, count)
+                if indexed > first:
+                    self.id_ids = self.np.concatenate([self.id_ids, self.np.array(ids[first:indexed], dtype=str)])
+                    first = indexed
+                if first < count:
+                    self._add_to_index(ids[first:], vectors_array[first:])
+                replayed += count - (mapped - start)
+            offset = end
+        
+        if replayed:
+            logger.info(f"Replayed {replayed} vectors from {self.wal_path}")
+        return replayed, offset
+    
+    def add_vectors(self, ids, vectors, normalized=False):
         """
         Add vectors to the index
         
         Args:
             ids: List of IDs (strings or ints)
             vectors: List of vectors (numpy arrays)
+            normalized: The vectors already have unit length, so
+                normalization is skipped
         """
         try:
-            if not ids or not vectors or len(ids) != len(vectors):
+            if not ids or vectors is None or len(ids) != len(vectors):
                 logger.warning("Invalid IDs or vectors")
                 return
             
-            # Convert vectors to numpy array
-            vectors_array = self.np.array(vectors).astype('float32')
-            
-            # Add to index
-            self.index.add(vectors_array)
-            
-            # Update ID mapping
-            base_index = len(self.id_map)
-            for i, id_val in enumerate(ids):
-                self.id_map[base_index + i] = str(id_val)
-            
-            # Save index
-            self._save_index()
+            # Convert vectors to a contiguous float32 array. Unless it can be
+            # used as-is, the array is a copy, so normalizing in place never
+            # touches the caller's array.
+            if normalized:
+                vectors_array = self.np.ascontiguousarray(vectors, dtype=self.np.float32)
+            else:
+                vectors_array = self.np.array(vectors, dtype=self.np.float32, order='C')
+                self.faiss.normalize_L2(vectors_array)
+            ids = [str(id_val) for id_val in ids]
+            
+            start = self.index.ntotal
+            self._add_to_index(ids, vectors_array)
+            
+            # Log the batch rather than rewriting the whole index, until the
+            # log gets large
+            self._append_wal(start, ids, vectors_array)
+            if self.wal.tell() >= FAISS_WAL_MAX_BYTES:
+                self.flush()
             
             logger.info(f"Added {len(ids)} vectors to FAISS index")
         except Exception as e:
             logger.error(f"Error adding vectors to FAISS: {e}")
     
-    def search(self, query_vector, top_k=5):
+    def _add_to_index(self, ids, vectors_array):
+        """Add vectors to the index (and its GPU copy) and map their rows to the IDs"""
+        self._ensure_writable()
+        cpu_index = self.index
+        self.index.add(vectors_array)
+        self._maybe_train()
+        if self.gpu_enabled:
+            if self.index is not cpu_index:
+                # Moved to a trained index, copy that instead
+                self._refresh_gpu_index()
+            elif self.gpu_index is not None:
+                self.gpu_index.add(vectors_array)
+        
+        # Update ID mapping
+        new_ids = self.np.array(ids, dtype=str)
+        self.id_ids = self.np.concatenate([self.id_ids, new_ids])
+    
+    def search(self, query_vector, top_k=5, normalized=False):
         """
         Search for similar vectors
         
         Args:
             query_vector: Query vector
             top_k: Number of results to return
+            normalized: The query already has unit length, so
+                normalization is skipped
             
         Returns:
             List of (ID, distance) tuples
         """
+        query_vector = self.np.asarray(query_vector, dtype=self.np.float32).reshape(1, -1)
+        results = self.search_batch(query_vector, top_k, normalized)
+        return results[0] if results else []
+    
+    def search_batch(self, query_vectors, top_k=5, normalized=False):
+        """
+        Search for similar vectors for many queries in one index call
+        
+        Args:
+            query_vectors: Query vectors, as an (n, dimension) array or list of vectors
+            top_k: Number of results to return per query
+            normalized: The queries already have unit length, so
+                normalization is skipped
+            
+        Returns:
+            List with a list of (ID, distance) tuples per query
+        """
         try:
             if self.index.ntotal == 0:
                 logger.warning("Index is empty, no results to return")
                 return []
             
-            # Convert query to numpy array
-            if not isinstance(query_vector, self.np.ndarray):
-                query_vector = self.np.array(query_vector).astype('float32')
-            
-            # Reshape if needed
-            if len(query_vector.shape) == 1:
-                query_vector = query_vector.reshape(1, -1)
-            
-            # Search index
-            distances, indices = self.index.search(query_vector, min(top_k, self.index.ntotal))
-            
-            # Map indices to original IDs
-            results = []
-            for i, idx in enumerate(indices[0]):
-                if idx >= 0 and str(idx) in self.id_map:  # -1 indicates no result
-                    results.append((self.id_map[str(idx)], float(distances[0][i])))
-            
-            return results
+            # One contiguous float32 matrix for the whole batch, normalized
+            # like the stored vectors
+            if normalized:
+                query_vectors = self.np.ascontiguousarray(query_vectors, dtype=self.np.float32)
+            else:
+                query_vectors = self.np.array(query_vectors, dtype=self.np.float32, order='C')
+                self.faiss.normalize_L2(query_vectors)
+            
+            # Search index, on GPU if there is a copy there
+            index = self.gpu_index if self.gpu_index is not None else self.index
+            distances, indices = index.search(query_vectors, min(top_k, self.index.ntotal))
+            if self.index.metric_type == self.faiss.METRIC_INNER_PRODUCT:
+                # Report squared L2 distance between the unit vectors
+                # (2 - 2 * cosine), as indexes built with METRIC_L2 did.
+                # float64 keeps the -FLT_MAX padding of short result lists
+                # from overflowing.
+                distances = 2.0 - 2.0 * distances.astype(self.np.float64)
+            
+            # Map rows to original IDs by indexing the ID array; -1
+            # indicates no result
+            id_ids = self.id_ids
+            found = (indices >= 0) & (indices < len(id_ids))
+            all_results = []
+            for found_row, indices_row, distances_row in zip(found, indices, distances):
+                all_results.append(list(zip(id_ids[indices_row[found_row]].tolist(),
+                                            distances_row[found_row].tolist())))
+            
+            return all_results
         except Exception as e:
             logger.error(f"Error searching FAISS index: {e}")
             return []
@@ -638,7 +1000,7 @@ class FaissVectorService:
             'vector_count': self.index.ntotal,
             'dimension': self.dimension,
             'index_type': type(self.index).__name__,
-            'id_mapping_count': len(self.id_map)
+            'id_mapping_count': len(self.id_ids)
         }
 
 # Wrapper service that combines ClickHouse and FAISS
@@ -668,8 +1030,8 @@ class DatabaseService:
             chunk_ids = self.db.add_chunks(document_id, chunks)
             
             # Generate embeddings and add to FAISS
-            vectors = [self._generate_embeddings(chunk) for chunk in chunks]
-            self.vector_service.add_vectors(chunk_ids, vectors)
+            vectors = self._generate_embeddings_batch(chunks)
+            self.vector_service.add_vectors(chunk_ids, vectors, normalized=True)
             
             return document_id
         except Exception as e:
@@ -713,21 +1075,35 @@ class DatabaseService:
         """
         Generate embeddings for text
         
-        This is a simplified random embedding generator for demonstration.
+        This is a simplified hash-based embedding generator for demonstration.
         In a real application, you would use a proper embedding model.
         """
-        import numpy as np
+        return self._generate_embeddings_batch([text])[0]
+    
+    def _generate_embeddings_batch(self, texts):
+        """
+        Generate embeddings for many texts at once
         
-        # For consistency, seed the random generator with the hash of the text
-        np.random.seed(hash(text) % 2**32)
+        Args:
+            texts: List of texts
+            
+        Returns:
+            (len(texts), dimension) float32 array of unit-length embeddings
+        """
+        import numpy as np
         
-        # Generate a random vector
-        vector = np.random.rand(self.vector_service.dimension).astype(np.float32)
+        # Expand each text into dimension * 4 bytes with SHAKE-256 and read
+        # them as little-endian int32 components. Unlike seeding the global
+        # random generator with hash(text), this is thread-safe and gives
+        # the same vector in every process (str hashes are salted per process).
+        dimension = self.vector_service.dimension
+        digests = b''.join(hashlib.shake_256(text.encode('utf-8')).digest(dimension * 4) for text in texts)
+        vectors = np.frombuffer(digests, dtype='<i4').reshape(len(texts), dimension).astype(np.float32)
         
-        # Normalize to unit length
-        vector = vector / np.linalg.norm(vector)
+        # Normalize all rows to unit length in place in one call
+        self.vector_service.faiss.normalize_L2(vectors)
         
-        return vector
+        return vectors
     
     def search_similar(self, query, top_k=5):
         """Search for chunks similar to the query"""
@@ -736,7 +1112,7 @@ class DatabaseService:
             query_vector = self._generate_embeddings(query)
             
             # Search FAISS index
-            results = self.vector_service.search(query_vector, top_k)
+            results = self.vector_service.search(query_vector, top_k, normalized=True)
             
             # Get chunk details
             chunks = []
@@ -783,8 +1159,8 @@ class DatabaseService:
             chunk_ids = self.db.add_page_chunks(page_id, chunks)
             
             # Generate embeddings and add to FAISS
-            vectors = [self._generate_embeddings(chunk) for chunk in chunks]
-            self.vector_service.add_vectors(chunk_ids, vectors)
+            vectors = self._generate_embeddings_batch(chunks)
+            self.vector_service.add_vectors(chunk_ids, vectors, normalized=True)
             
             return page_id
         except Exception as e:
@@ -2,9 +2,11 @@
 """
 Script to read FAISS database information and display statistics
 """
+import io
 import os
 import sys
 import json
+import pickle
 import logging
 import faiss
 import numpy as np
@@ -16,7 +18,11 @@ logger = logging.getLogger(__name__)
 
 # FAISS configuration
 FAISS_INDEX_PATH = os.environ.get('FAISS_INDEX_PATH', 'data/faiss_index.bin')
-FAISS_MAPPING_PATH = os.environ.get('FAISS_MAPPING_PATH', 'data/faiss_id_mapping.json')
+FAISS_MAPPING_PATH = os.environ.get('FAISS_MAPPING_PATH', 'data/faiss_id_mapping.npz')
+# Mappings written by earlier versions (pickle, and JSON before that) sit
+# next to the current one with these extensions until VectorService
+# migrates them
+LEGACY_FAISS_MAPPING_EXTENSIONS = ('.pkl', '.json')
 FAISS_DIMENSION = int(os.environ.get('FAISS_DIMENSION', 384))
 
 def get_index_size_bytes(index_path):
@@ -43,9 +49,21 @@ def format_size(size_bytes):
 def load_id_mapping(mapping_path):
     """Load the ID mapping file"""
     try:
+        if not os.path.exists(mapping_path):
+            stem = os.path.splitext(mapping_path)[0]
+            legacy_paths = (stem + ext for ext in LEGACY_FAISS_MAPPING_EXTENSIONS)
+            mapping_path = next((path for path in legacy_paths if os.path.exists(path)), mapping_path)
         if os.path.exists(mapping_path):
-            with open(mapping_path, 'r') as f:
-                return json.load(f)
+            with open(mapping_path, 'rb') as f:
+                data = f.read()
+            # Saved as parallel external / internal ID arrays
+            if data.startswith(b'PK'):
+                with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+                    return dict(zip(arrays['ext_ids'].tolist(), arrays['int_ids'].tolist()))
+            # Older versions saved the mapping as pickle or JSON
+            if data.lstrip().startswith(b'{'):
+                return json.loads(data)
+            return pickle.loads(data)
         return {}
     except Exception as e:
         logger.error(f"Error loading ID mapping: {e}")
@@ -186,6 +204,10 @@ def search_similar_vector(query_id, top_k=5):
                 
             # Search similar vectors
             D, I = index.search(np.array([query_vector]), top_k)
+            if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                # Indexes over unit vectors store inner products; report
+                # squared L2 distance like IndexFlatL2 indexes
+                D = 2.0 - 2.0 * D.astype(np.float64)
             
             # Map internal IDs back to external IDs
             reverse_mapping = {v: k for k, v in id_mapping.items()}
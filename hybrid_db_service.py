@@ -107,11 +107,11 @@ class FaissVectorStore:
     
     def add_vectors(self, ids: List[str], vectors: List[List[float]]):
         """Add vectors to the index"""
-        if not ids or not vectors:
+        if not ids or vectors is None or len(vectors) == 0:
             return
         
-        # Convert to numpy array
-        vectors_np = np.array(vectors).astype('float32')
+        # Convert to a contiguous float32 array (no copy if it already is one)
+        vectors_np = np.ascontiguousarray(vectors, dtype=np.float32)
         
         # Get current index size
         current_size = self.index.ntotal
@@ -137,8 +137,8 @@ class FaissVectorStore:
             logger.warning("FAISS index is empty, returning empty results")
             return []
         
-        # Convert to numpy array
-        query_np = np.array([query_vector]).astype('float32')
+        # Convert to a contiguous float32 row (no copy if it already is one)
+        query_np = np.ascontiguousarray(query_vector, dtype=np.float32).reshape(1, -1)
         
         # Search index
         distances, indices = self.index.search(query_np, top_k)
@@ -5,8 +5,16 @@ from flask import Flask, jsonify, render_template, request, Response, send_from_
 import random
 from datetime import datetime, timedelta
 import time
+import threading
+import zlib
 import requests
 from flask import stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Import the blueprints
 from routes.local_llm import local_llm_bp
@@ -16,9 +24,27 @@ from routes.anomalies import anomalies_bp
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s:%(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that uses orjson for request parsing and jsonify"""
+    
+    def dumps(self, obj, **kwargs):
+        # Datetimes go through Flask's default handler so the output format is unchanged
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 # Initialize Flask app
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "super-secret-key")
 
 # Disable template caching during development
@@ -52,16 +78,6 @@ def index():
 def llm_assistant():
     return render_template('llm_assistant.html')
 
-# RAG page - using blueprint now
-# @app.route('/rag')
-# def rag():
-#     return render_template('rag.html')
-
-# Anomalies page - using blueprint now
-# @app.route('/anomalies')
-# def anomalies():
-#     return render_template('anomalies.html')
-
 # Data Pipeline page
 @app.route('/data-pipeline')
 def data_pipeline():
@@ -72,156 +88,6 @@ def data_pipeline():
 def kafka_browser():
     return render_template('kafka_browser_simple.html', active_tab='kafka_browser')
 
-# Function below is no longer used - keeping for reference
-def kafka_browser_old():
-    # Prepare mock data for templates
-    kafka_topics = [
-        {
-            "name": "logs-topic",
-            "partitions": 3,
-            "replication": 3,
-            "message_count": 524892,
-            "throughput": "120 msg/sec",
-            "size": "750 MB",
-            "retention": "7 days",
-            "created": "2025-04-01 00:00:00"
-        },
-        {
-            "name": "metrics-topic",
-            "partitions": 5,
-            "replication": 3,
-            "message_count": 328157,
-            "throughput": "250 msg/sec",
-            "size": "1.2 GB",
-            "retention": "14 days",
-            "created": "2025-04-01 00:00:00"
-        },
-        {
-            "name": "events-topic",
-            "partitions": 2,
-            "replication": 3,
-            "message_count": 125628,
-            "throughput": "45 msg/sec",
-            "size": "380 MB",
-            "retention": "30 days",
-            "created": "2025-04-02 00:00:00"
-        },
-        {
-            "name": "alerts-topic",
-            "partitions": 1,
-            "replication": 3,
-            "message_count": 8421,
-            "throughput": "5 msg/sec",
-            "size": "12 MB",
-            "retention": "90 days",
-            "created": "2025-04-02 00:00:00"
-        },
-        {
-            "name": "clickstream-topic",
-            "partitions": 8,
-            "replication": 3,
-            "message_count": 1458276,
-            "throughput": "850 msg/sec",
-            "size": "3.5 GB",
-            "retention": "3 days",
-            "created": "2025-04-03 00:00:00"
-        }
-    ]
-    
-    kafka_messages = [
-        {
-            "offset": 1000050,
-            "partition": 1,
-            "key": "srv-web-01",
-            "value": {
-                "timestamp": "2025-05-22T04:55:12.000Z",
-                "level": "INFO",
-                "service": "api-gateway",
-                "message": "Request processed successfully",
-                "requestId": "abcd1234",
-                "duration": 125
-            },
-            "timestamp": "2025-05-22 04:55:12"
-        },
-        {
-            "offset": 1000049,
-            "partition": 0,
-            "key": "srv-auth-02",
-            "value": {
-                "timestamp": "2025-05-22T04:55:10.000Z",
-                "level": "WARN",
-                "service": "auth-service",
-                "message": "Rate limit exceeded",
-                "requestId": "efgh5678",
-                "duration": 350
-            },
-            "timestamp": "2025-05-22 04:55:10"
-        },
-        {
-            "offset": 1000048,
-            "partition": 2,
-            "key": "srv-db-01",
-            "value": {
-                "timestamp": "2025-05-22T04:55:08.000Z",
-                "level": "ERROR",
-                "service": "database",
-                "message": "Connection timeout",
-                "requestId": "ijkl9012",
-                "duration": 500
-            },
-            "timestamp": "2025-05-22 04:55:08"
-        }
-    ]
-    
-    consumer_groups = [
-        {
-            "id": "log-processor-group",
-            "members": 3,
-            "topics": ["logs-topic", "app-logs"],
-            "total_lag": 275,
-            "status": "Stable",
-            "status_class": "success"
-        },
-        {
-            "id": "metrics-analyzer",
-            "members": 5,
-            "topics": ["metrics-topic", "system-metrics"],
-            "total_lag": 482,
-            "status": "Stable",
-            "status_class": "success"
-        },
-        {
-            "id": "clickstream-processor",
-            "members": 8,
-            "topics": ["clickstream-topic"],
-            "total_lag": 8763,
-            "status": "Warning",
-            "status_class": "warning"
-        }
-    ]
-    
-    stats = {
-        "broker_count": 3,
-        "total_topics": 15,
-        "consumer_groups_count": 12,
-        "total_messages": "1,862,473",
-        "selected_topic": "logs-topic",
-        "topic_message_count": "524,892",
-        "topic_avg_size": "1.4 KB",
-        "topic_top_partition": 1,
-        "topic_message_rate": "120 msg/sec"
-    }
-    
-    import json
-    for msg in kafka_messages:
-        msg["value_json"] = json.dumps(msg["value"])
-    
-    return render_template('kafka_browser.html',
-                          kafka_topics=kafka_topics,
-                          kafka_messages=kafka_messages,
-                          consumer_groups=consumer_groups,
-                          stats=stats)
-
 # Simplified standalone pages that show data
 @app.route('/simple-data-pipeline')
 def simple_data_pipeline():
@@ -245,30 +111,37 @@ def api_dashboard_metrics():
         'last_updated': datetime.now().isoformat()
     })
 
+# Sample data for the recent Kafka messages feed
+KAFKA_SAMPLE_TOPICS = ('logs', 'metrics', 'alerts', 'transactions', 'events')
+KAFKA_SAMPLE_MESSAGES = (
+    "System startup completed",
+    "User login successful",
+    "New data received from source",
+    "Processing completed successfully",
+    "CPU spike detected",
+    "Memory usage increased",
+    "Database backup completed",
+    "New anomaly detected",
+    "Alert triggered by sensor",
+    "Scheduled task started"
+)
+
+# Dedicated generator so the sample feed doesn't share the global Random instance
+_sample_rng = random.Random()
+
 @app.route('/api/kafka/recent-messages', methods=['GET'])
 def api_kafka_recent_messages():
     """Return recent Kafka messages for the dashboard"""
     messages = []
-    topics = ['logs', 'metrics', 'alerts', 'transactions', 'events']
+    randrange = _sample_rng.randrange
     
     for _ in range(5):
         messages.append({
-            'topic': random.choice(topics),
-            'content': random.choice([
-                "System startup completed",
-                "User login successful",
-                "New data received from source",
-                "Processing completed successfully",
-                "CPU spike detected",
-                "Memory usage increased",
-                "Database backup completed",
-                "New anomaly detected",
-                "Alert triggered by sensor",
-                "Scheduled task started"
-            ]),
-            'timestamp': (datetime.now() - timedelta(minutes=random.randint(0, 60))).isoformat(),
-            'size': random.randint(200, 1500),
-            'key': f'key-{random.randint(1, 100)}'
+            'topic': KAFKA_SAMPLE_TOPICS[randrange(len(KAFKA_SAMPLE_TOPICS))],
+            'content': KAFKA_SAMPLE_MESSAGES[randrange(len(KAFKA_SAMPLE_MESSAGES))],
+            'timestamp': (datetime.now() - timedelta(minutes=randrange(61))).isoformat(),
+            'size': randrange(200, 1501),
+            'key': f'key-{randrange(1, 101)}'
         })
     
     return jsonify({'messages': messages})
@@ -381,7 +254,7 @@ def api_storage_info():
 @app.route('/api/rag/search', methods=['POST'])
 def api_rag_search():
     """Perform RAG search with the given query"""
-    data = request.json
+    data = request.get_json(silent=True)
     if not data or 'query' not in data:
         return jsonify({'error': 'Query parameter is required'}), 400
     
@@ -411,64 +284,147 @@ def api_rag_search():
         'total_docs_searched': random.randint(50, 200)
     })
 
+# System prompts for the LLM assistant, keyed by agent type
+AGENT_SYSTEM_PROMPTS = {
+    'general': "You are a helpful, friendly assistant that provides accurate and concise information.",
+    'coding': "You are a coding expert that helps with programming problems, explains code, and suggests best practices.",
+    'data': "You are a data analysis expert that helps with statistics, data visualization, and data science concepts.",
+}
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant that provides accurate and useful information."
+
+# Local LLM endpoint and circuit breaker settings: after repeated connection
+# failures the upstream call is skipped for a cooldown period instead of
+# making every request wait for the connect timeout
+LOCAL_LLM_GENERATE_URL = 'http://localhost:15000/api/local-llm/generate'
+LLM_CONNECT_TIMEOUT = 5  # seconds
+LLM_BREAKER_THRESHOLD = 3
+LLM_BREAKER_COOLDOWN = 30  # seconds
+
+_llm_breaker = {'fails': 0, 'open_until': 0.0}
+_llm_breaker_lock = threading.Lock()
+
+def _llm_breaker_is_open():
+    """Return True while the local LLM circuit breaker is open"""
+    with _llm_breaker_lock:
+        return time.monotonic() < _llm_breaker['open_until']
+
+def _llm_breaker_record(success):
+    """Record the outcome of a local LLM connection attempt"""
+    with _llm_breaker_lock:
+        if success:
+            _llm_breaker['fails'] = 0
+            _llm_breaker['open_until'] = 0.0
+        else:
+            _llm_breaker['fails'] += 1
+            if _llm_breaker['fails'] >= LLM_BREAKER_THRESHOLD:
+                _llm_breaker['open_until'] = time.monotonic() + LLM_BREAKER_COOLDOWN
+
+def _gzip_frames(frames, level=1):
+    """Compress a stream of SSE frames into one gzip stream, flushing after each frame"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for frame in frames:
+        yield compressor.compress(frame.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def _parse_flag(value, default):
+    """Read a boolean request field, accepting the strings form- and query-style clients send"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ('1', 'true', 'yes', 'on'):
+            return True
+        if lowered in ('0', 'false', 'no', 'off', ''):
+            return False
+    elif isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    raise ValueError(f"not a boolean: {value!r}")
+
 # LLM API route
 @app.route('/api/llm/query', methods=['POST'])
 def api_llm_query():
     """Process an LLM query and return the response"""
-    data = request.json or {}
+    data = request.get_json(silent=True) or {}
     prompt = data.get('prompt', '')
     
     if not prompt:
         return jsonify({'error': 'Prompt is required'}), 400
     
-    # Get agent settings
-    settings = data.get('settings', {})
-    temperature = settings.get('temperature', 0.7)
-    max_tokens = settings.get('max_tokens', 1024)
+    # Get agent settings, coercing numeric values sent as strings
+    settings = data.get('settings') or {}
+    if not isinstance(settings, dict):
+        return jsonify({'error': 'settings must be an object'}), 400
+    try:
+        temperature = float(settings.get('temperature', 0.7))
+        max_tokens = int(settings.get('max_tokens', 1024))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'temperature and max_tokens must be numeric'}), 400
+    agent_type = data.get('agent_type') or 'general'
+    
+    # Clients that don't animate token-by-token can ask for the whole
+    # response in a single SSE frame
+    try:
+        use_rag = _parse_flag(data.get('use_rag'), False)
+        stream = _parse_flag(data.get('stream'), True)
+    except ValueError:
+        return jsonify({'error': 'use_rag and stream must be booleans'}), 400
     
     # Use streaming response to the local LLM endpoint
     try:
         # Create system prompt based on agent type
-        agent_type = data.get('agent_type', 'general')
-        
-        if agent_type == 'general':
-            system_prompt = "You are a helpful, friendly assistant that provides accurate and concise information."
-        elif agent_type == 'coding':
-            system_prompt = "You are a coding expert that helps with programming problems, explains code, and suggests best practices."
-        elif agent_type == 'data':
-            system_prompt = "You are a data analysis expert that helps with statistics, data visualization, and data science concepts."
-        else:
-            system_prompt = "You are a helpful assistant that provides accurate and useful information."
+        system_prompt = AGENT_SYSTEM_PROMPTS.get(agent_type, DEFAULT_SYSTEM_PROMPT)
             
         # Handle RAG if enabled
-        use_rag = data.get('use_rag', False)
         if use_rag:
             # This is a placeholder for actual RAG implementation
             system_prompt += "\n\n[Relevant information from knowledge base would be added here]"
         
         def generate():
             try:
+                # Fail fast while the local LLM is known to be down
+                if _llm_breaker_is_open():
+                    error_msg = "LLM service is unavailable, please try again later"
+                    logger.warning(error_msg)
+                    yield f"data: {json.dumps({'error': error_msg})}\n\n"
+                    yield "data: [DONE]\n\n"
+                    return
+                
                 # Make request to the local LLM API
-                response = requests.post(
-                    'http://localhost:15000/api/local-llm/generate',
-                    json={
-                        'prompt': prompt, 
-                        'system_prompt': system_prompt,
-                        'stream': True,
-                        'max_tokens': max_tokens,
-                        'temperature': temperature
-                    },
-                    stream=True
-                )
+                try:
+                    response = requests.post(
+                        LOCAL_LLM_GENERATE_URL,
+                        json={
+                            'prompt': prompt, 
+                            'system_prompt': system_prompt,
+                            'stream': stream,
+                            'max_tokens': max_tokens,
+                            'temperature': temperature
+                        },
+                        stream=stream,
+                        timeout=(LLM_CONNECT_TIMEOUT, None)
+                    )
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    _llm_breaker_record(False)
+                    raise
+                _llm_breaker_record(True)
                 
                 # Check if the request was successful
                 if response.status_code != 200:
                     error_msg = f"Error from LLM API: {response.text}"
-                    logging.error(error_msg)
+                    logger.error(error_msg)
                     yield f"data: {json.dumps({'error': error_msg})}\n\n"
                     yield "data: [DONE]\n\n"
                     return
                 
+                # Send the complete response as one frame
+                if not stream:
+                    text = response.json().get('text', '')
+                    yield f"data: {json.dumps({'text': text})}\n\n"
+                    yield "data: [DONE]\n\n"
+                    return
+                
                 # Stream the response
                 for line in response.iter_lines():
                     if line:
@@ -476,15 +432,22 @@ def api_llm_query():
                         yield f"{line}\n\n"
             except Exception as e:
                 error_msg = f"Error in LLM streaming: {str(e)}"
-                logging.error(error_msg)
+                logger.error(error_msg)
                 yield f"data: {json.dumps({'error': error_msg})}\n\n"
                 yield "data: [DONE]\n\n"
         
-        return Response(stream_with_context(generate()), mimetype='text/event-stream')
+        # Compress single-frame responses; token frames are too small to benefit
+        if not stream and 'gzip' in request.accept_encodings:
+            response = Response(stream_with_context(_gzip_frames(generate())), mimetype='text/event-stream')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+        response.vary.add('Accept-Encoding')
+        return response
     
     except Exception as e:
         error_msg = f"Error processing LLM request: {str(e)}"
-        logging.error(error_msg)
+        logger.error(error_msg)
         return jsonify({'error': error_msg}), 500
 
 # Start the server when run directly
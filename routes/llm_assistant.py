@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, request, jsonify
 from services.llm_service import LLMService
-from vector_service import VectorService
+from vector_service import get_vector_service
 from clickhouse_models import DocumentChunk
 import time
 import json
@@ -30,11 +30,13 @@ def query_llm():
         return stream_llm_response(prompt)
     
     try:
-        # Start timing for response time measurement
+        # Start timing for response time measurement; the monotonic clock
+        # is used for the duration so wall-clock jumps can't skew it
         start_time = time.time()
+        start_ns = time.monotonic_ns()
         
         # Search vector database for relevant context
-        vector_service = VectorService()
+        vector_service = get_vector_service()
         relevant_chunks = vector_service.search_similar_text(prompt, top_k=3)
         
         # Build context from relevant chunks
@@ -70,7 +72,7 @@ Please provide a helpful answer based on the context above. If the context doesn
         metadata = {
             'start_time': start_time,
             'end_time': end_time,
-            'response_time': end_time - start_time,
+            'response_time': (time.monotonic_ns() - start_ns) / 1_000_000_000,
             'model': 'mistral-7b-instruct',
             'client_ip': request.remote_addr,
             'user_agent': request.user_agent.string,
@@ -104,6 +106,7 @@ def stream_llm_response(prompt):
     
     # Prepare metadata for eventual storage
     start_time = time.time()
+    start_ns = time.monotonic_ns()
     metadata = {
         'start_time': start_time,
         'model': 'mistral-7b-instruct',
@@ -115,7 +118,7 @@ def stream_llm_response(prompt):
     def generate():
         try:
             # Search vector database for relevant context
-            vector_service = VectorService()
+            vector_service = get_vector_service()
             relevant_chunks = vector_service.search_similar_text(prompt, top_k=3)
             
             # Build context from relevant chunks
@@ -151,7 +154,7 @@ Please provide a helpful answer based on the context above. If the context doesn
             # After streaming completes, save to ClickHouse
             end_time = time.time()
             metadata['end_time'] = end_time
-            metadata['response_time'] = end_time - start_time
+            metadata['response_time'] = (time.monotonic_ns() - start_ns) / 1_000_000_000
             
             try:
                 prompt_id = LLMPrompt.create(
@@ -106,12 +106,12 @@ class EmbeddingService:
             tfidf_matrix = self.vectorizer.transform(texts)
             
             # Apply SVD for dimensionality reduction
-            embeddings = self.svd.transform(tfidf_matrix)
+            embeddings = self.svd.transform(tfidf_matrix).astype('float32')
             
-            # Normalize embeddings
-            embeddings = normalize(embeddings, norm='l2')
+            # Normalize embeddings in place
+            normalize(embeddings, norm='l2', copy=False)
             
-            return embeddings.astype('float32')
+            return embeddings
             
         except Exception as e:
             logger.error(f"Error encoding texts: {e}")
@@ -105,8 +105,8 @@ class VectorDBService:
         # Generate a random vector of the right dimension
         vector = np.random.rand(self.vector_dim).astype(np.float32)
         
-        # Normalize to unit length
-        vector = vector / np.linalg.norm(vector)
+        # Normalize to unit length in place
+        vector /= np.linalg.norm(vector)
         
         return vector
     
@@ -0,0 +1,178 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+from vector_service import VectorService
+
+
+def test_migrates_legacy_l2_index(tmp_path):
+    """An IndexFlatL2 saved by earlier versions keeps its ranking after migration"""
+    dimension = 8
+    rng = np.random.default_rng(0)
+    # Vectors of very different lengths, as earlier versions stored them
+    vectors = rng.standard_normal((20, dimension)).astype(np.float32)
+    vectors *= rng.uniform(0.1, 10.0, size=(20, 1)).astype(np.float32)
+
+    index_path = tmp_path / "faiss_index.bin"
+    mapping_path = tmp_path / "faiss_id_mapping.json"
+    legacy_index = faiss.IndexFlatL2(dimension)
+    legacy_index.add(vectors)
+    faiss.write_index(legacy_index, str(index_path))
+    mapping_path.write_text(json.dumps({f"doc{i}": i for i in range(len(vectors))}))
+
+    service = VectorService(dimension=dimension, index_path=str(index_path), mapping_path=str(mapping_path))
+    assert isinstance(service.index, faiss.IndexIDMap2)
+    assert service.index.ntotal == len(vectors)
+
+    for i in range(len(vectors)):
+        results = service.search(vectors[i].tolist(), top_k=3)
+        assert results[0][0] == f"doc{i}"
+        assert all(distance >= -1e-5 for _, distance in results)
+
+
+def test_compacting_ivfpq_keeps_trained_codes(tmp_path, monkeypatch):
+    """Compacting an IVF-PQ index keeps its codebooks and the survivors' codes, even with few survivors"""
+    import vector_service
+    monkeypatch.setattr(vector_service, "FAISS_INDEX_TYPE", "ivfpq")
+    monkeypatch.setattr(vector_service, "FAISS_IVF_THRESHOLD", 1000)
+    monkeypatch.setattr(vector_service, "FAISS_PQ_M", 4)
+
+    dimension = 16
+    vectors = np.random.default_rng(0).standard_normal((1000, dimension)).astype(np.float32)
+    service = VectorService(dimension=dimension, index_path=str(tmp_path / "faiss_index.bin"),
+                            mapping_path=str(tmp_path / "faiss_id_mapping.npz"))
+    assert service.add_vectors([f"doc{i}" for i in range(1000)], vectors)
+    ivf = faiss.downcast_index(service.index.index)
+    assert isinstance(ivf, faiss.IndexIVF)
+    centroids = ivf.quantizer.reconstruct_n(0, ivf.nlist)
+    query = vectors[950:951] / np.linalg.norm(vectors[950])
+    before = service.index.search(query, 5)
+
+    assert service.delete_vectors([f"doc{i}" for i in range(900)])
+    assert len(service.id_mapping) == 100
+    assert service.index.ntotal == 100
+
+    ivf = faiss.downcast_index(service.index.index)
+    np.testing.assert_array_equal(ivf.quantizer.reconstruct_n(0, ivf.nlist), centroids)
+    # Surviving vectors score exactly as they did before compaction
+    after = service.index.search(query, 5)
+    survivors = before[1][0] >= 900
+    np.testing.assert_array_equal(after[1][0][:survivors.sum()], before[1][0][survivors])
+    np.testing.assert_allclose(after[0][0][:survivors.sum()], before[0][0][survivors])
+    assert service.search(vectors[950].tolist(), top_k=1)[0][0] == "doc950"
+    assert service.add_vectors(["new"], vectors[:1])
+    assert service.search(vectors[0].tolist(), top_k=1)[0][0] == "new"
+
+
+def test_search_skips_deleted_and_replaced_vectors(tmp_path, monkeypatch):
+    """Deleted and re-added IDs never crowd live vectors out of the top k"""
+    import vector_service
+    monkeypatch.setattr(vector_service, "FAISS_INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(vector_service, "FAISS_REBUILD_THRESHOLD", 1.0)
+
+    dimension = 8
+    vectors = np.random.default_rng(0).standard_normal((200, dimension)).astype(np.float32)
+    service = VectorService(dimension=dimension, index_path=str(tmp_path / "faiss_index.bin"),
+                            mapping_path=str(tmp_path / "faiss_id_mapping.npz"))
+    service.add_vectors([f"doc{i}" for i in range(200)], vectors)
+
+    # Delete the nearest neighbours of the query; HNSW keeps them as tombstones
+    query = vectors[0]
+    nearest = [doc_id for doc_id, _ in service.search_exact([query.tolist()], top_k=50)[0]]
+    assert service.delete_vectors(nearest[:40])
+    assert service.index.ntotal == 200
+
+    expected = nearest[40:45]
+    assert [doc_id for doc_id, _ in service.search(query.tolist(), top_k=5)] == expected
+    assert [doc_id for doc_id, _ in service.search_exact([query.tolist()], top_k=5)[0]] == expected
+
+    # Re-adding an ID replaces its vector
+    service.add_vectors([expected[0]], -query[np.newaxis, :])
+    assert expected[0] not in [doc_id for doc_id, _ in service.search(query.tolist(), top_k=5)]
+
+
+def test_readding_replaces_vector_in_flat_index(tmp_path):
+    """Flat indexes drop the vector an ID had before it was re-added"""
+    dimension = 8
+    vectors = np.random.default_rng(0).standard_normal((10, dimension)).astype(np.float32)
+    service = VectorService(dimension=dimension, index_path=str(tmp_path / "faiss_index.bin"),
+                            mapping_path=str(tmp_path / "faiss_id_mapping.npz"))
+    service.add_vectors([f"doc{i}" for i in range(10)], vectors)
+    service.add_vectors(["doc0", "doc1"], vectors[:2])
+    assert service.index.ntotal == 10
+    assert service.search(vectors[0].tolist(), top_k=1)[0][0] == "doc0"
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivfpq"])
+def test_memory_mapped_index_accepts_writes(tmp_path, monkeypatch, index_type):
+    """A writable service with FAISS_MMAP reads the mapped index in before changing it"""
+    import vector_service
+    monkeypatch.setattr(vector_service, "FAISS_INDEX_TYPE", index_type)
+    monkeypatch.setattr(vector_service, "FAISS_IVF_THRESHOLD", 300)
+    monkeypatch.setattr(vector_service, "FAISS_PQ_M", 2)
+
+    dimension = 8
+    vectors = np.random.default_rng(0).standard_normal((310, dimension)).astype(np.float32)
+    paths = dict(index_path=str(tmp_path / "faiss_index.bin"), mapping_path=str(tmp_path / "faiss_id_mapping.npz"))
+    service = VectorService(dimension=dimension, **paths)
+    service.add_vectors([f"doc{i}" for i in range(300)], vectors[:300])
+    service.flush()
+
+    monkeypatch.setattr(vector_service, "FAISS_MMAP", True)
+    service = VectorService(dimension=dimension, **paths)
+    assert service.add_vectors([f"doc{i}" for i in range(300, 310)], vectors[300:])
+    assert service.delete_vectors(["doc0"])
+    assert len(service.id_mapping) == 309
+    assert service.search(vectors[305].tolist(), top_k=1)[0][0] == "doc305"
+
+
+def test_failed_add_leaves_mapping_unchanged(tmp_path, monkeypatch):
+    """Vectors the index rejects don't leave their IDs mapped"""
+    dimension = 8
+    service = VectorService(dimension=dimension, index_path=str(tmp_path / "faiss_index.bin"),
+                            mapping_path=str(tmp_path / "faiss_id_mapping.npz"))
+    service.add_vectors(["doc0"], np.ones((1, dimension), dtype=np.float32))
+
+    def reject(*args):
+        raise RuntimeError("add rejected")
+    monkeypatch.setattr(service.index, "add_with_ids", reject)
+    assert not service.add_vectors(["doc0", "doc1"], np.ones((2, dimension), dtype=np.float32))
+    assert service.id_mapping == {"doc0": 0}
+    assert service._num_deleted() == 0
+    assert service.search(np.ones(dimension).tolist(), top_k=1)[0][0] == "doc0"
+
+
+def test_migrates_legacy_mapping_next_to_mapping_path(tmp_path, monkeypatch):
+    """Legacy mappings are looked up beside mapping_path, not in the working directory"""
+    dimension = 8
+    store = tmp_path / "store"
+    store.mkdir()
+    index = faiss.IndexFlatL2(dimension)
+    index.add(np.eye(dimension, dtype=np.float32)[:2])
+    faiss.write_index(index, str(store / "index.bin"))
+    (store / "mapping.json").write_text(json.dumps({"a": 0, "b": 1}))
+
+    # An unrelated mapping at the default location must not be picked up
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "faiss_id_mapping.json").write_text(json.dumps({"other": 0}))
+
+    service = VectorService(dimension=dimension, index_path=str(store / "index.bin"),
+                            mapping_path=str(store / "mapping.npz"))
+    assert service.id_mapping == {"a": 0, "b": 1}
+    assert (store / "mapping.npz").exists()
+
+
+def test_reverse_mapping_tracks_live_ids_only(tmp_path):
+    """Re-adding and deleting IDs doesn't grow the internal-to-external map"""
+    dimension = 8
+    vectors = np.random.default_rng(0).standard_normal((10, dimension)).astype(np.float32)
+    service = VectorService(dimension=dimension, index_path=str(tmp_path / "faiss_index.bin"),
+                            mapping_path=str(tmp_path / "faiss_id_mapping.npz"))
+    for _ in range(5):
+        service.add_vectors([f"doc{i}" for i in range(10)], vectors)
+    service.delete_vectors(["doc9"])
+    assert service._int_to_ext == {v: k for k, v in service.id_mapping.items()}
+    assert len(service._int_to_ext) == 9
@@ -3,15 +3,30 @@ FAISS Vector Service
 This module provides interfaces for the FAISS vector database with real TF-IDF embeddings
 """
 import os
+import atexit
+
+# OpenMP threads that spin while idle starve FAISS and an OpenBLAS with its
+# own thread pool; these only take effect if set before numpy and faiss are
+# first imported, and values from the environment win
+os.environ.setdefault('OMP_WAIT_POLICY', 'PASSIVE')
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+
 import json
+import functools
+import hashlib
+import itertools
 import logging
 import numpy as np
 import faiss
 import pickle
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple, Any, Optional
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.decomposition import TruncatedSVD
-from sklearn.preprocessing import normalize
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,22 +35,111 @@ logger = logging.getLogger(__name__)
 # Default configuration for real embeddings
 FAISS_DIMENSION = int(os.environ.get('FAISS_DIMENSION', 128))  # Increased for real embeddings
 FAISS_INDEX_PATH = os.environ.get('FAISS_INDEX_PATH', 'data/faiss_index.bin')
-FAISS_MAPPING_PATH = os.environ.get('FAISS_MAPPING_PATH', 'data/faiss_id_mapping.json')
+FAISS_MAPPING_PATH = os.environ.get('FAISS_MAPPING_PATH', 'data/faiss_id_mapping.npz')
+# Mappings written by earlier versions (pickle, and JSON before that) sit
+# next to the current one with these extensions
+LEGACY_FAISS_MAPPING_EXTENSIONS = ('.pkl', '.json')
 EMBEDDING_MODEL_PATH = os.environ.get('EMBEDDING_MODEL_PATH', 'data/embedding_model.pkl')
 
+# Number of single-text encodings (e.g. repeated search queries) kept per model
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 4096))
+
+# Embedding backend: 'hashing' (stateless feature hashing, nothing to fit or
+# save), 'tfidf' (TF-IDF + SVD fitted on the corpus, better quality) or
+# 'auto', which keeps using a saved TF-IDF model so existing indexes stay
+# searchable and uses hashing otherwise
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'auto').lower()
+
+# Batches larger than EMBEDDING_CHUNK_SIZE texts are encoded in chunks on up to
+# EMBEDDING_WORKERS threads (the sparse transforms and projection release the GIL)
+EMBEDDING_CHUNK_SIZE = int(os.environ.get('EMBEDDING_CHUNK_SIZE', 1000))
+EMBEDDING_WORKERS = int(os.environ.get('EMBEDDING_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Index type for new indexes: 'flat' (exact search), 'hnsw' (approximate, sub-linear search),
+# 'sq8' (exhaustive search over vectors stored as 8-bit codes, a quarter of the memory)
+# 'hnsw_sq8' (HNSW over 8-bit codes) or 'ivfpq' (starts flat, then switches to an inverted
+# file over product-quantized codes once it holds FAISS_IVF_THRESHOLD vectors)
+FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE', 'flat').lower()
+FAISS_HNSW_M = int(os.environ.get('FAISS_HNSW_M', 32))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.environ.get('FAISS_HNSW_EF_CONSTRUCTION', 200))
+FAISS_HNSW_EF_SEARCH = int(os.environ.get('FAISS_HNSW_EF_SEARCH', 64))
+FAISS_IVF_THRESHOLD = int(os.environ.get('FAISS_IVF_THRESHOLD', 10000))
+FAISS_PQ_M = int(os.environ.get('FAISS_PQ_M', 16))
+# Inverted lists scanned per query, trading recall for speed; 0 picks nlist / 16
+FAISS_IVF_NPROBE = int(os.environ.get('FAISS_IVF_NPROBE', 0))
+
+# Fraction of unreachable vectors tolerated in indexes that can't remove
+# vectors in place (e.g. HNSW) before they are compacted
+FAISS_REBUILD_THRESHOLD = float(os.environ.get('FAISS_REBUILD_THRESHOLD', 0.2))
+
+# Seconds to wait after a change before writing the index to disk, so
+# bursts of writes are saved once
+FAISS_SAVE_DELAY = float(os.environ.get('FAISS_SAVE_DELAY', 1.0))
+
+# Save synchronously after this many add_vectors calls since the last save,
+# including calls with persist=False; 0 disables
+FAISS_AUTOFLUSH_ADDS = int(os.environ.get('FAISS_AUTOFLUSH_ADDS', 0))
+
+# Memory-map saved indexes in writable services too, so vector storage is
+# paged in on demand rather than read up front; the first change reads the
+# index into memory. Read-only services always memory-map.
+FAISS_MMAP = os.environ.get('FAISS_MMAP', 'false').lower() in ('1', 'true', 'yes')
+
+# Threads for index operations; inner-product search only parallelises
+# across queries when FAISS is allowed the threads, but throughput drops
+# again past 16
+FAISS_NUM_THREADS = int(os.environ.get('FAISS_NUM_THREADS', min(16, os.cpu_count() or 1)))
+faiss.omp_set_num_threads(FAISS_NUM_THREADS)
+
+# Mirror the index on GPU 0 for large batched searches. Single queries stay
+# on the CPU, where they don't pay for the transfer to the device.
+FAISS_USE_GPU = os.environ.get('FAISS_USE_GPU', 'false').lower() in ('1', 'true', 'yes')
+FAISS_GPU_MIN_BATCH = int(os.environ.get('FAISS_GPU_MIN_BATCH', 64))
+
+# Split flat indexes into this many shards searched on parallel threads when
+# there are fewer queries than shards. FAISS parallelises flat search over
+# queries, so a lone query otherwise scans the whole index on one core.
+# 0 or 1 disables; the shards hold a second copy of the vectors.
+FAISS_SEARCH_SHARDS = int(os.environ.get('FAISS_SEARCH_SHARDS', 0))
+
+def _blas_name() -> str:
+    """Name of the BLAS library numpy is linked against, if numpy reports it"""
+    try:
+        return np.show_config(mode='dicts')['Build Dependencies']['blas']['name']
+    except Exception:
+        return 'unknown'
+
+_BLAS_NAME = _blas_name()
+logger.info(f"FAISS using {FAISS_NUM_THREADS} threads, numpy BLAS: {_BLAS_NAME}")
+if 'openblas' in _BLAS_NAME.lower() and FAISS_NUM_THREADS > 1:
+    logger.warning("OpenBLAS detected: multi-threaded FAISS search may degrade; "
+                   "prefer an MKL build or set FAISS_NUM_THREADS=1 if latency is unstable")
+
 class RealEmbeddingModel:
-    """Real embedding model using TF-IDF + SVD for semantic similarity"""
+    """Real embedding model using feature hashing or TF-IDF + SVD for semantic similarity"""
     
-    def __init__(self, dimension=128, model_path=EMBEDDING_MODEL_PATH):
+    def __init__(self, dimension=128, model_path=EMBEDDING_MODEL_PATH, backend=EMBEDDING_BACKEND):
         self.dimension = dimension
         self.model_path = model_path
+        if backend == 'auto':
+            backend = 'tfidf' if os.path.exists(model_path) else 'hashing'
+        self.backend = backend
         self.vectorizer = None
         self.svd = None
+        self._components_t = None  # float32 copy of svd.components_.T
         self.is_fitted = False
+        # Per-instance cache of encode_text results, stored as immutable
+        # bytes so callers can't modify a cached embedding; cleared whenever
+        # the model is refitted
+        self._encode_one_cached = functools.lru_cache(maxsize=EMBEDDING_CACHE_SIZE)(self._encode_one)
         self._load_or_create_model()
     
     def _load_or_create_model(self):
         """Load existing model or create new one"""
+        if self.backend == 'hashing':
+            self._create_hashing_model()
+            return
+        
         try:
             if os.path.exists(self.model_path):
                 with open(self.model_path, 'rb') as f:
@@ -63,6 +167,21 @@ class RealEmbeddingModel:
         self.is_fitted = False
         logger.info("Created new TF-IDF embedding model")
     
+    def _create_hashing_model(self):
+        """Create a stateless model that hashes words and bigrams straight to
+        unit-length vectors, so there is nothing to fit or save"""
+        self.vectorizer = HashingVectorizer(
+            n_features=self.dimension,
+            stop_words='english',
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm='l2',
+            dtype=np.float32
+        )
+        self.svd = None
+        self.is_fitted = True
+        logger.info("Created hashing embedding model")
+    
     def _save_model(self):
         """Save the trained model"""
         try:
@@ -72,21 +191,23 @@ class RealEmbeddingModel:
                 'svd': self.svd
             }
             with open(self.model_path, 'wb') as f:
-                pickle.dump(model_data, f)
+                pickle.dump(model_data, f, protocol=pickle.HIGHEST_PROTOCOL)
             logger.info(f"Saved embedding model to {self.model_path}")
         except Exception as e:
             logger.error(f"Error saving model: {e}")
     
     def fit_texts(self, texts):
         """Fit the model on a collection of texts"""
-        if not texts:
+        if not texts or self.backend == 'hashing':
             return
         try:
             # Fit TF-IDF vectorizer
             tfidf_matrix = self.vectorizer.fit_transform(texts)
             # Fit SVD for dimensionality reduction
             self.svd.fit(tfidf_matrix)
+            self._components_t = None
             self.is_fitted = True
+            self._encode_one_cached.cache_clear()
             self._save_model()
             logger.info(f"Fitted embedding model on {len(texts)} texts")
         except Exception as e:
@@ -98,18 +219,73 @@ class RealEmbeddingModel:
             # Auto-fit on the input texts if not fitted
             self.fit_texts(texts)
         
+        if len(texts) <= EMBEDDING_CHUNK_SIZE or EMBEDDING_WORKERS <= 1:
+            return self._encode_chunk(texts)
+        
+        # Fitting is done above, once, so the chunks only transform; each one
+        # writes its rows straight into the shared output array
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        
+        def encode_into(start):
+            end = min(start + EMBEDDING_CHUNK_SIZE, len(texts))
+            embeddings[start:end] = self._encode_chunk(texts[start:end])
+        
+        with ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS) as executor:
+            list(executor.map(encode_into, range(0, len(texts), EMBEDDING_CHUNK_SIZE)))
+        return embeddings
+    
+    def _encode_chunk(self, texts):
+        """Encode a batch of texts with the fitted model"""
         try:
+            if self.backend == 'hashing':
+                # Rows come out L2-normalized already
+                return self.vectorizer.transform(texts).toarray()
+            
             # Transform to TF-IDF
-            tfidf_matrix = self.vectorizer.transform(texts)
-            # Apply SVD
-            embeddings = self.svd.transform(tfidf_matrix)
-            # Normalize
-            embeddings = normalize(embeddings, norm='l2')
-            return embeddings.astype('float32')
+            tfidf_matrix = self.vectorizer.transform(texts).astype(np.float32)
+            # Apply SVD as one sparse x dense product straight into float32
+            # (what svd.transform does, without the float64 result)
+            if self._components_t is None:
+                self._components_t = np.ascontiguousarray(self.svd.components_.T, dtype=np.float32)
+            embeddings = np.ascontiguousarray(tfidf_matrix @ self._components_t, dtype=np.float32)
+            # Normalize in place in one pass (all-zero rows stay zero)
+            faiss.normalize_L2(embeddings)
+            return embeddings
         except Exception as e:
             logger.error(f"Error encoding texts: {e}")
-            # Fallback to random vectors if encoding fails
-            return np.random.randn(len(texts), self.dimension).astype('float32')
+            # Fallback to random unit vectors if encoding fails
+            embeddings = np.random.randn(len(texts), self.dimension).astype('float32')
+            faiss.normalize_L2(embeddings)
+            return embeddings
+    
+    def _encode_one(self, text):
+        """Encode a single text to the raw bytes of its float32 embedding"""
+        return self.encode_texts([text])[0].tobytes()
+    
+    def encode_text(self, text):
+        """Encode a single text, reusing the result for texts seen recently"""
+        return np.frombuffer(self._encode_one_cached(text), dtype=np.float32)
+
+def format_size(num_bytes: int) -> str:
+    """Format a byte count for display, e.g. 1536 -> '1.5 KB'"""
+    for unit, scale in (("GB", 1 << 30), ("MB", 1 << 20), ("KB", 1 << 10)):
+        if num_bytes >= scale:
+            return f"{num_bytes / scale:.1f} {unit}"
+    return f"{num_bytes} B"
+
+def load_id_mapping_file(path: str) -> Dict[str, int]:
+    """Read an ID mapping saved as packed arrays, or as pickle or JSON by earlier versions"""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+        if magic == b'PK':
+            # .npz archive of parallel external / internal ID arrays
+            f.seek(0)
+            with np.load(f, allow_pickle=False) as data:
+                return dict(zip(data['ext_ids'].tolist(), data['int_ids'].tolist()))
+        data = magic + f.read()
+    if data.lstrip().startswith(b'{'):
+        return json.loads(data)
+    return pickle.loads(data)
 
 # Global embedding model instance
 _embedding_model = None
@@ -121,124 +297,420 @@ def get_embedding_model():
         _embedding_model = RealEmbeddingModel()
     return _embedding_model
 
+def _flush_if_alive(flush_ref: weakref.WeakMethod):
+    """atexit handler: flush a VectorService unless it has been garbage collected"""
+    flush = flush_ref()
+    if flush is not None:
+        flush()
+
 class VectorService:
-    """Service for vector operations using FAISS"""
+    """
+    Service for vector operations using FAISS
     
-    def __init__(self, dimension=FAISS_DIMENSION, index_path=None, mapping_path=None):
-        """Initialize the vector service"""
+    Threading is configured at import: OMP_WAIT_POLICY=PASSIVE and
+    OPENBLAS_NUM_THREADS=1 unless already set, and FAISS_NUM_THREADS OpenMP
+    threads. FAISS linked against MKL is preferred; with OpenBLAS, multi-
+    threaded search can degrade badly, so consider FAISS_NUM_THREADS=1 there.
+    """
+    
+    def __init__(self, dimension=FAISS_DIMENSION, index_path=None, mapping_path=None, read_only=False):
+        """
+        Initialize the vector service
+        
+        Args:
+            read_only: Memory-map the saved index instead of reading it into
+                memory. Pages load on demand and are shared between processes;
+                the service can only search.
+        """
         self.dimension = dimension
         self.index_path = index_path or FAISS_INDEX_PATH
         self.mapping_path = mapping_path or FAISS_MAPPING_PATH
+        self.read_only = read_only
         
         # Create data directory if it doesn't exist
         os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
         
         # Initialize index and ID mapping
         self.index = None
+        # The index is memory-mapped read-only and must be read into memory
+        # before it is changed (see _ensure_writable)
+        self._index_mapped = False
         self.id_mapping = {}
+        # Internal ID -> external ID, kept in sync with id_mapping. A dict
+        # rather than a list indexed by internal ID: IDs are never reused,
+        # so a list would keep growing with holes as vectors are deleted
+        # and re-added.
+        self._int_to_ext: Dict[int, str] = {}
+        self._next_internal_id = 0
+        
+        # Read-only GPU copy of the index, refreshed on the first large
+        # search after a change; all writes go to the CPU index
+        self._gpu_res = None
+        self._gpu_index = None
+        self._gpu_stale = True
+        
+        # Selector that skips deleted vectors still held by the index
+        # (e.g. HNSW, which can't remove them), rebuilt after changes
+        self._live_sel = None
+        self._live_sel_stale = True
+        
+        # Sharded copy of a flat index for small searches, refreshed the
+        # same way
+        self._shards = None
+        self._shard_tiles = []
+        self._shards_stale = True
+        
+        # ((mtime_ns, size), formatted size) of the index file for get_stats
+        self._index_size_cache = None
+        
+        # Per-thread (1, dimension) scratch buffer for single-vector search
+        self._local = threading.local()
+        
+        if FAISS_USE_GPU:
+            # get_num_gpus() is 0 both for CPU-only builds and for GPU builds
+            # on machines without a usable device
+            if hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0:
+                self._gpu_res = faiss.StandardGpuResources()
+            else:
+                logger.warning("FAISS_USE_GPU is set but no GPU is available to FAISS")
+        
+        # Changes are persisted by a background thread; the lock keeps it from
+        # writing the index while it is being modified
+        self._dirty = False
+        self._save_lock = threading.RLock()
+        self._save_queue = queue.Queue()
+        self._save_thread = None
+        self._adds_since_flush = 0
+        
         self._load_or_create_index()
         
+        # Don't lose changes still waiting for the background save on exit.
+        # The handler holds the service weakly, so it doesn't keep every
+        # instance alive until the process exits.
+        if not self.read_only:
+            atexit.register(_flush_if_alive, weakref.WeakMethod(self.flush))
+        
         logger.info(f"FAISS initialized with dimension {self.dimension}")
     
     def _load_or_create_index(self):
         """Load an existing index or create a new one"""
         try:
             if os.path.exists(self.index_path):
-                self.index = faiss.read_index(self.index_path)
-                logger.info(f"Loaded FAISS index from {self.index_path}")
+                if self.read_only:
+                    self.index = self._read_index_mmap()
+                elif FAISS_MMAP:
+                    # Mapped read-only until the first change reads it in
+                    self.index = self._read_index_mmap()
+                else:
+                    self.index = faiss.read_index(self.index_path)
+                    logger.info(f"Loaded FAISS index from {self.index_path}")
             else:
                 self._create_new_index()
                 logger.info("Creating new FAISS index")
             
             self._load_id_mapping()
+            
+            if not isinstance(self.index, faiss.IndexIDMap2):
+                self._migrate_to_id_map()
+            
+            self._apply_search_settings()
         except Exception as e:
             logger.error(f"Error loading FAISS index: {e}")
             self._create_new_index()
             self.id_mapping = {}
+            self._rebuild_reverse_mapping()
+        
+        self._init_next_internal_id()
+    
+    def _apply_search_settings(self):
+        """Apply the configured efSearch and nprobe to the loaded index"""
+        # Both are saved with the index; applying the configured values lets
+        # them be tuned without rebuilding
+        if isinstance(self.index, faiss.IndexIDMap2):
+            base = faiss.downcast_index(self.index.index)
+            if isinstance(base, faiss.IndexHNSW):
+                base.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+            elif isinstance(base, faiss.IndexIVF) and FAISS_IVF_NPROBE:
+                base.nprobe = FAISS_IVF_NPROBE
+    
+    def _read_index_mmap(self):
+        """Memory-map the saved index, falling back to reading it into memory"""
+        read_only_mmap = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        flag_sets = [read_only_mmap]
+        if hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+            # Only newer FAISS maps flat vector storage (flat, HNSW and
+            # scalar-quantized indexes); IVF lists only map with the plain flags
+            flag_sets.insert(0, read_only_mmap | faiss.IO_FLAG_MMAP_IFC)
+        
+        for flags in flag_sets:
+            try:
+                index = faiss.read_index(self.index_path, flags)
+                self._index_mapped = True
+                logger.info(f"Memory-mapped FAISS index from {self.index_path}")
+                return index
+            except RuntimeError as e:
+                logger.debug(f"Could not memory-map FAISS index with flags {flags:#x}: {e}")
+        
+        logger.info(f"{self.index_path} can't be memory-mapped, reading it into memory")
+        return faiss.read_index(self.index_path)
+    
+    def _ensure_writable(self):
+        """Replace a memory-mapped index with an in-memory copy that can be changed"""
+        if not self._index_mapped:
+            return
+        
+        # Nothing has been written to the mapped index, so the file on
+        # disk still matches it
+        self.index = faiss.read_index(self.index_path)
+        self._index_mapped = False
+        self._apply_search_settings()
+        self._mark_search_copies_stale()
+        logger.info(f"Read memory-mapped FAISS index into memory for writing ({self.index.ntotal} vectors)")
+    
+    def _init_next_internal_id(self):
+        """Start internal IDs after the largest one in use"""
+        # Include deleted vectors still held by the index so their IDs are
+        # never reused
+        next_id = max(self.id_mapping.values(), default=-1) + 1
+        if isinstance(self.index, faiss.IndexIDMap2) and self.index.ntotal:
+            next_id = max(next_id, int(faiss.vector_to_array(self.index.id_map).max()) + 1)
+        self._next_internal_id = next_id
     
     def _create_new_index(self):
         """Create a new FAISS index"""
-        # Using IndexFlatL2 for simplicity and accuracy
-        # In production, you might want to use a more efficient index type
-        self.index = faiss.IndexFlatL2(self.dimension)
+        self.index = self._build_index()
+        self._index_mapped = False
         self._save_index()
     
+    def _build_index(self):
+        """Build an empty index of the configured type, addressed by internal ID"""
+        # IndexIDMap2 stores our internal IDs alongside the vectors, so search
+        # returns them directly and vectors can be removed without a rebuild
+        return faiss.IndexIDMap2(self._build_base_index())
+    
+    def _build_base_index(self):
+        """Build the underlying vector storage of the configured type"""
+        # Vectors are normalized to unit length, so inner product gives the
+        # same ranking as L2 distance without the norm computation
+        if FAISS_INDEX_TYPE == 'hnsw':
+            # Approximate search with logarithmic query cost for large corpora
+            index = faiss.IndexHNSWFlat(self.dimension, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+            return index
+        
+        if FAISS_INDEX_TYPE == 'hnsw_sq8':
+            # HNSW graph over 8-bit codes: sub-linear search with a quarter
+            # of the vector memory
+            index = faiss.IndexHNSWSQ(self.dimension, faiss.ScalarQuantizer.QT_8bit, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+            self._train_unit_range(index)
+            return index
+        
+        if FAISS_INDEX_TYPE == 'sq8':
+            # Scanning int8 codes moves a quarter of the bytes of float32
+            index = faiss.IndexScalarQuantizer(self.dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            self._train_unit_range(index)
+            return index
+        
+        # Exact search ('ivfpq' indexes also start out flat, as IVF needs
+        # enough vectors to train on)
+        return faiss.IndexFlatIP(self.dimension)
+    
+    def _train_unit_range(self, index):
+        """Train a scalar quantizer on the [-1, 1] range of unit-vector components"""
+        # Training on the bounds rather than a sample means later vectors
+        # can't fall outside the trained range
+        bounds = np.ones((2, self.dimension), dtype=np.float32)
+        bounds[0] = -1.0
+        index.train(bounds)
+    
+    def _migrate_to_id_map(self):
+        """Convert an index saved without IDs, where internal IDs are row positions"""
+        legacy_index = self.index
+        if legacy_index.ntotal > 0 and legacy_index.d != self.dimension:
+            logger.error(f"Cannot migrate FAISS index with dimension {legacy_index.d}, expected {self.dimension}")
+            return
+        
+        self.index = self._build_index()
+        self._index_mapped = False
+        if legacy_index.ntotal > 0:
+            vectors_np = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+            # Legacy IndexFlatL2 vectors were stored as given; the new index
+            # compares by inner product, which needs unit vectors
+            faiss.normalize_L2(vectors_np)
+            self.index.add_with_ids(vectors_np, np.arange(legacy_index.ntotal, dtype=np.int64))
+        
+        self._save_index()
+        logger.info(f"Migrated FAISS index to {type(self.index).__name__} with {self.index.ntotal} vectors")
+    
     def _load_id_mapping(self):
         """Load ID mapping from disk"""
         try:
             if os.path.exists(self.mapping_path):
-                with open(self.mapping_path, 'r') as f:
-                    self.id_mapping = json.load(f)
+                self.id_mapping = load_id_mapping_file(self.mapping_path)
+            else:
+                # Migrate a mapping written by earlier versions once, so
+                # later loads read the packed format
+                stem = os.path.splitext(self.mapping_path)[0]
+                for legacy_path in (stem + ext for ext in LEGACY_FAISS_MAPPING_EXTENSIONS):
+                    if os.path.exists(legacy_path):
+                        self.id_mapping = load_id_mapping_file(legacy_path)
+                        self._save_id_mapping()
+                        logger.info(f"Migrated legacy ID mapping from {legacy_path} to {self.mapping_path}")
+                        break
         except Exception as e:
             logger.error(f"Error loading ID mapping: {e}")
             self.id_mapping = {}
+        self._rebuild_reverse_mapping()
+    
+    def _rebuild_reverse_mapping(self):
+        """Rebuild the internal -> external ID lookup from id_mapping"""
+        self._int_to_ext = dict(zip(self.id_mapping.values(), self.id_mapping.keys()))
     
     def _save_id_mapping(self):
         """Save ID mapping to disk"""
+        if self.read_only:
+            return
         try:
-            with open(self.mapping_path, 'w') as f:
-                json.dump(self.id_mapping, f)
+            # Write to a temporary file and swap it in, so a crash mid-write
+            # can't leave a truncated mapping behind
+            tmp_path = f"{self.mapping_path}.tmp"
+            # Stored as two parallel arrays rather than a pickled dict
+            with open(tmp_path, 'wb') as f:
+                np.savez(f,
+                         ext_ids=np.array(list(self.id_mapping), dtype=str),
+                         int_ids=np.fromiter(self.id_mapping.values(), dtype=np.int64, count=len(self.id_mapping)))
+            os.replace(tmp_path, self.mapping_path)
         except Exception as e:
             logger.error(f"Error saving ID mapping: {e}")
     
     def _save_index(self):
         """Save index to disk"""
+        if self.read_only:
+            return
         try:
             os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
-            faiss.write_index(self.index, self.index_path)
+            # Write a sibling file and swap it in: truncating the file in
+            # place would pull the pages out from under a memory-mapped
+            # index, and a crash mid-write would leave it corrupt
+            tmp_path = f"{self.index_path}.tmp"
+            faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
         except Exception as e:
             logger.error(f"Error saving FAISS index: {e}")
     
-    def add_vectors(self, ids: List[str], vectors: List[List[float]]) -> bool:
+    def _schedule_save(self):
+        """Mark the index as changed and queue a save on the background thread"""
+        self._dirty = True
+        if self._save_thread is None or not self._save_thread.is_alive():
+            self._save_thread = threading.Thread(target=self._save_worker, name="faiss-saver", daemon=True)
+            self._save_thread.start()
+        self._save_queue.put(None)
+    
+    def _save_worker(self):
+        """Save the index once changes stop arriving for FAISS_SAVE_DELAY seconds"""
+        while True:
+            self._save_queue.get()
+            time.sleep(FAISS_SAVE_DELAY)
+            # Requests queued while waiting are covered by this save
+            while True:
+                try:
+                    self._save_queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.flush()
+    
+    def flush(self):
+        """Write pending changes to the index and ID mapping to disk"""
+        with self._save_lock:
+            if not self._dirty:
+                return
+            self._save_index()
+            self._save_id_mapping()
+            self._dirty = False
+            self._adds_since_flush = 0
+    
+    def add_vectors(self, ids: List[str], vectors: List[List[float]], persist: bool = True,
+                    normalized: bool = False) -> bool:
         """
         Add vectors to the index
         
         Args:
             ids: List of external IDs (strings)
-            vectors: List of vectors (each a list of floats)
+            vectors: List of vectors (each a list of floats) or a 2-D array
+            persist: Schedule a background save. Bulk loaders can pass False
+                and call flush() once after the last batch.
+            normalized: The vectors already have unit length (e.g. from
+                encode_texts), so normalization is skipped
             
         Returns:
             bool: Success status
         """
+        if self.read_only:
+            logger.error("Cannot add vectors: vector service is read-only")
+            return False
+        
         try:
-            if not ids or not vectors or len(ids) != len(vectors):
-                logger.error(f"Invalid inputs: ids={len(ids) if ids else 0}, vectors={len(vectors) if vectors else 0}")
+            num_ids = len(ids) if ids is not None else 0
+            num_vectors = len(vectors) if vectors is not None else 0
+            if not num_ids and not num_vectors:
+                # Nothing to add, and nothing to save
+                return True
+            if num_ids != num_vectors:
+                logger.error(f"Invalid inputs: ids={num_ids}, vectors={num_vectors}")
                 return False
             
-            # Fix vector dimensions if needed
-            fixed_vectors = []
-            for i, vector in enumerate(vectors):
-                if len(vector) != self.dimension:
-                    logger.warning(f"Vector dimension mismatch: got {len(vector)}, expected {self.dimension}. Adjusting...")
-                    if len(vector) > self.dimension:
-                        # Truncate vector
-                        fixed_vectors.append(vector[:self.dimension])
-                    else:
-                        # Pad vector with zeros
-                        padding = [0.0] * (self.dimension - len(vector))
-                        fixed_vectors.append(vector + padding)
+            # Fix vector dimensions if needed, on the whole matrix at once
+            if isinstance(vectors, np.ndarray) and vectors.ndim == 2:
+                fixed_vectors = vectors
+            else:
+                lengths = np.fromiter(map(len, vectors), dtype=np.int64, count=num_vectors)
+                if (lengths == lengths[0]).all():
+                    fixed_vectors = np.asarray(vectors, dtype=np.float32)
                 else:
-                    fixed_vectors.append(vector)
+                    # Ragged rows: flatten them in one pass, drop the values
+                    # past the dimension and scatter the rest into a
+                    # zero-padded matrix
+                    logger.warning(f"Vector dimension mismatch: got lengths {lengths.min()}-{lengths.max()}, expected {self.dimension}. Adjusting...")
+                    flat = np.fromiter(itertools.chain.from_iterable(vectors), dtype=np.float32, count=int(lengths.sum()))
+                    row_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+                    flat = flat[np.arange(len(flat)) - row_starts < self.dimension]
+                    fixed_vectors = np.zeros((num_vectors, self.dimension), dtype=np.float32)
+                    fixed_vectors[np.arange(self.dimension) < np.minimum(lengths, self.dimension)[:, np.newaxis]] = flat
             
-            # Convert vectors to numpy array
-            vectors_np = np.array(fixed_vectors).astype('float32')
-            
-            # Get current maximum internal ID
-            next_id = max(self.id_mapping.values()) + 1 if self.id_mapping else 0
-            
-            # Add vectors to index
-            internal_ids = list(range(next_id, next_id + len(vectors_np)))
+            if fixed_vectors.ndim != 2:
+                logger.error(f"Invalid vectors: expected shape (n, {self.dimension}), got {fixed_vectors.shape}")
+                return False
+            if fixed_vectors.shape[1] != self.dimension:
+                logger.warning(f"Vector dimension mismatch: got {fixed_vectors.shape[1]}, expected {self.dimension}. Adjusting...")
+                if fixed_vectors.shape[1] > self.dimension:
+                    # Truncate vectors
+                    fixed_vectors = fixed_vectors[:, :self.dimension]
+                else:
+                    # Pad vectors with zeros
+                    fixed_vectors = np.pad(fixed_vectors, ((0, 0), (0, self.dimension - fixed_vectors.shape[1])))
             
-            # Map external IDs to internal IDs
-            for i, ext_id in enumerate(ids):
-                self.id_mapping[ext_id] = internal_ids[i]
+            # Convert vectors to a contiguous float32 array in one step
+            # (no float64 intermediate). Unless it can be used as-is, the
+            # array is a copy, so normalizing in place never touches the
+            # caller's array.
+            if normalized:
+                vectors_np = np.ascontiguousarray(fixed_vectors, dtype=np.float32)
+            else:
+                vectors_np = np.array(fixed_vectors, dtype=np.float32, order='C')
+                faiss.normalize_L2(vectors_np)
             
-            # Add to FAISS index
-            self.index.add(vectors_np)
+            with self._save_lock:
+                self._add_to_index(ids, vectors_np)
+                self._dirty = True
+                self._adds_since_flush += 1
             
-            # Save changes
-            self._save_index()
-            self._save_id_mapping()
+            if FAISS_AUTOFLUSH_ADDS and self._adds_since_flush >= FAISS_AUTOFLUSH_ADDS:
+                self.flush()
+            elif persist:
+                self._schedule_save()
             
             logger.info(f"Added {len(vectors)} vectors to index with dimension {self.dimension}")
             return True
@@ -246,6 +718,85 @@ class VectorService:
             logger.error(f"Error adding vectors: {e}")
             return False
     
+    def _add_to_index(self, ids: List[str], vectors_np: np.ndarray):
+        """Assign internal IDs to the external IDs and add the vectors under them"""
+        self._ensure_writable()
+        next_id = self._next_internal_id
+        
+        # Add to FAISS index under their internal IDs first, so an add that
+        # fails (e.g. on the wrong dimension) leaves the mapping untouched
+        self.index.add_with_ids(vectors_np, np.arange(next_id, next_id + len(vectors_np), dtype=np.int64))
+        self._next_internal_id += len(vectors_np)
+        
+        # Map internal IDs to external IDs
+        int_to_ext = self._int_to_ext
+        int_to_ext.update(zip(range(next_id, next_id + len(ids)), ids))
+        
+        # Map external IDs to internal IDs
+        superseded = set()
+        for internal_id, ext_id in enumerate(ids, next_id):
+            # Re-adding an existing ID replaces its old lookup entry
+            old_internal_id = self.id_mapping.get(ext_id)
+            if old_internal_id is not None:
+                del int_to_ext[old_internal_id]
+                superseded.add(old_internal_id)
+            self.id_mapping[ext_id] = internal_id
+        
+        if superseded:
+            # Drop the vectors they replace, as delete_vectors would
+            self._remove_from_index(superseded)
+        self._mark_search_copies_stale()
+        
+        if (FAISS_INDEX_TYPE == 'ivfpq' and self.index.ntotal >= FAISS_IVF_THRESHOLD
+                and isinstance(faiss.downcast_index(self.index.index), faiss.IndexFlat)):
+            self._upgrade_to_ivfpq()
+    
+    def _upgrade_to_ivfpq(self):
+        """Replace the index with an IVF-PQ index trained on its live vectors"""
+        old_base = faiss.downcast_index(self.index.index)
+        if isinstance(old_base, faiss.IndexIVF):
+            # IVF indexes can only reconstruct by ID through a direct map
+            old_base.make_direct_map()
+        labels = faiss.vector_to_array(self.index.id_map)
+        all_vectors = old_base.reconstruct_n(0, self.index.ntotal)
+        live_ids = np.fromiter(self.id_mapping.values(), dtype=np.int64, count=len(self.id_mapping))
+        keep = np.isin(labels, live_ids)
+        vectors = np.ascontiguousarray(all_vectors[keep])
+        
+        # ~4 * sqrt(N) inverted lists; PQ sub-quantizers must divide the dimension
+        nlist = max(1, int(4 * np.sqrt(len(vectors))))
+        pq_m = max(m for m in range(1, min(FAISS_PQ_M, self.dimension) + 1) if self.dimension % m == 0)
+        
+        base = faiss.index_factory(self.dimension, f"IVF{nlist},PQ{pq_m}", faiss.METRIC_INNER_PRODUCT)
+        base.train(vectors)
+        faiss.extract_index_ivf(base).nprobe = FAISS_IVF_NPROBE or max(1, nlist // 16)
+        
+        new_index = faiss.IndexIDMap2(base)
+        new_index.add_with_ids(vectors, labels[keep])
+        logger.info(f"Switched FAISS index to IVF{nlist},PQ{pq_m} with {new_index.ntotal} vectors")
+        self.index = new_index
+        self._mark_search_copies_stale()
+    
+    def set_nprobe(self, nprobe: int) -> bool:
+        """
+        Set how many inverted lists an IVF index scans per query
+        
+        Args:
+            nprobe: Lists to scan; higher improves recall, lower is faster
+            
+        Returns:
+            bool: False if the index is not an IVF index
+        """
+        with self._save_lock:
+            if not isinstance(self.index, faiss.IndexIDMap2):
+                return False
+            base = faiss.downcast_index(self.index.index)
+            if not isinstance(base, faiss.IndexIVF):
+                return False
+            base.nprobe = nprobe
+            self._mark_search_copies_stale()
+            return True
+    
     def add_documents(self, doc_ids: List[str], texts: List[str]) -> bool:
         """
         Add documents to the vector store using real TF-IDF embeddings
@@ -265,14 +816,11 @@ class VectorService:
             # Get embedding model
             embedding_model = get_embedding_model()
             
-            # Generate real embeddings
+            # Generate real embeddings, already normalized to unit length
             embeddings = embedding_model.encode_texts(texts)
             
-            # Convert embeddings to list format for add_vectors
-            embedding_vectors = [embedding.tolist() for embedding in embeddings]
-            
             # Add to vector store
-            return self.add_vectors(doc_ids, embedding_vectors)
+            return self.add_vectors(doc_ids, embeddings, normalized=True)
             
         except Exception as e:
             logger.error(f"Error adding documents: {e}")
@@ -293,17 +841,47 @@ class VectorService:
             # Get embedding model
             embedding_model = get_embedding_model()
             
-            # Generate embedding for query
-            query_embeddings = embedding_model.encode_texts([query_text])
-            query_vector = query_embeddings[0].tolist()
+            # Generate embedding for query, already normalized to unit length;
+            # repeated queries are served from the model's cache
+            query_embedding = embedding_model.encode_text(query_text)
             
             # Search using the embedding
-            return self.search(query_vector, top_k)
+            results = self.search_batch(query_embedding[np.newaxis, :], top_k, normalized=True)
+            return results[0] if results else []
             
         except Exception as e:
             logger.error(f"Error searching similar text: {e}")
             return []
     
+    def search_similar_texts(self, query_texts: List[str], top_k: int = 5) -> List[List[Tuple[str, float]]]:
+        """
+        Search for documents similar to each of several query texts, encoding
+        them together and searching with a single index call
+        
+        Args:
+            query_texts: The search query texts
+            top_k: Number of results to return per query
+            
+        Returns:
+            List of (document_id, similarity_score) tuple lists, one per query
+        """
+        if not query_texts:
+            return []
+        
+        try:
+            # Get embedding model
+            embedding_model = get_embedding_model()
+            
+            # Generate embeddings for all queries, already normalized to unit length
+            query_embeddings = embedding_model.encode_texts(query_texts)
+            
+            # Search using the embeddings
+            return self.search_batch(query_embeddings, top_k, normalized=True)
+            
+        except Exception as e:
+            logger.error(f"Error searching similar texts: {e}")
+            return []
+    
     def search(self, query_vector: List[float], top_k: int = 5) -> List[Tuple[str, float]]:
         """
         Search for similar vectors
@@ -316,30 +894,220 @@ class VectorService:
             List of (ID, distance) tuples
         """
         try:
-            # Convert to numpy array
-            query_np = np.array([query_vector]).astype('float32')
+            # Copy the query into this thread's reusable buffer instead of
+            # allocating a new array per call, and normalize it there
+            query_buf = getattr(self._local, 'query_buf', None)
+            if query_buf is None:
+                query_buf = self._local.query_buf = np.empty((1, self.dimension), dtype=np.float32)
+            query_buf[0] = query_vector
+            faiss.normalize_L2(query_buf)
+        except Exception as e:
+            logger.error(f"Error searching vectors: {e}")
+            return []
+        
+        results = self.search_batch(query_buf, top_k, normalized=True)
+        return results[0] if results else []
+    
+    def search_batch(self, query_vectors: List[List[float]], top_k: int = 5,
+                     normalized: bool = False) -> List[List[Tuple[str, float]]]:
+        """
+        Search for similar vectors for several queries with a single index call
+        
+        Args:
+            query_vectors: Query vectors (list of lists of floats or a 2-D array)
+            top_k: Number of results to return per query
+            normalized: The queries already have unit length, so
+                normalization is skipped
             
-            # Search index
-            D, I = self.index.search(query_np, top_k)
+        Returns:
+            List of (ID, distance) tuple lists, one per query
+        """
+        try:
+            # Stack all queries into one contiguous (nq, d) float32 array
+            # and normalize it like the stored vectors
+            if normalized:
+                query_np = np.ascontiguousarray(query_vectors, dtype=np.float32)
+            else:
+                query_np = np.array(query_vectors, dtype=np.float32, order='C')
+                faiss.normalize_L2(query_np)
             
-            # Map internal IDs back to external IDs
-            reverse_mapping = {v: k for k, v in self.id_mapping.items()}
+            index = None
+            with self._save_lock:
+                # Deleted vectors the index still holds are skipped during the
+                # search; the GPU and sharded copies can't do that, so they
+                # are only used when there are none
+                params = self._live_search_params()
+                if params is None and len(query_np) >= FAISS_GPU_MIN_BATCH:
+                    index = self._get_gpu_index()
+                elif params is None and len(query_np) < FAISS_SEARCH_SHARDS:
+                    index = self._get_search_shards()
+                if index is None:
+                    # Adds, deletes and compaction change or replace the
+                    # index under the lock, so it is searched under it too
+                    D, I = self.index.search(query_np, top_k, params=params)
+                    return self._map_results(D, I, top_k)
             
-            results = []
-            for i in range(len(I[0])):
-                internal_id = int(I[0][i])
-                if internal_id in reverse_mapping:
-                    results.append((reverse_mapping[internal_id], float(D[0][i])))
+            # The GPU and sharded copies are replaced rather than changed,
+            # so they can be searched without holding the lock
+            D, I = index.search(query_np, top_k)
+            return self._map_results(D, I, top_k)
+        except Exception as e:
+            logger.error(f"Error searching vectors: {e}")
+            return []
+    
+    def search_exact(self, query_vectors: List[List[float]], top_k: int = 5) -> List[List[Tuple[str, float]]]:
+        """
+        Brute-force search over the stored vectors, bypassing approximate
+        search structures such as the HNSW graph
+        
+        Args:
+            query_vectors: Query vectors (list of lists of floats or a 2-D array)
+            top_k: Number of results to return per query
+            
+        Returns:
+            List of (ID, distance) tuple lists, one per query
+        """
+        try:
+            query_np = np.array(query_vectors, dtype=np.float32, order='C')
+            faiss.normalize_L2(query_np)
             
-            return results
+            with self._save_lock:
+                storage = self._flat_storage()
+                if storage is None or self.index.ntotal == 0:
+                    # Vectors aren't stored as plain float32 (e.g. sq8)
+                    storage = None
+                else:
+                    # Run FAISS's brute-force kernel directly on zero-copy
+                    # views of the stored vectors and their internal IDs.
+                    # The lock keeps a concurrent add from reallocating them.
+                    ntotal = self.index.ntotal
+                    xb = faiss.rev_swig_ptr(storage.get_xb(), ntotal * self.dimension).reshape(ntotal, self.dimension)
+                    labels = faiss.rev_swig_ptr(self.index.id_map.data(), ntotal)
+                    k = min(top_k, ntotal)
+                    deleted = self._deleted_positions()
+                    if len(deleted):
+                        # Same brute-force scan, skipping deleted rows
+                        params = faiss.SearchParameters(sel=faiss.IDSelectorNot(faiss.IDSelectorBatch(deleted)))
+                        D, positions = storage.search(query_np, k, params=params)
+                    else:
+                        D, positions = faiss.knn(query_np, xb, k, metric=self.index.metric_type)
+                    I = np.where(positions >= 0, labels[positions], -1)
+            
+            if storage is None:
+                return self.search_batch(query_vectors, top_k)
+            return self._map_results(D, I, top_k)
         except Exception as e:
             logger.error(f"Error searching vectors: {e}")
             return []
     
+    def _flat_storage(self):
+        """The IndexFlat holding the raw vectors of a flat or HNSW index, or None"""
+        if not isinstance(self.index, faiss.IndexIDMap2):
+            return None
+        base = faiss.downcast_index(self.index.index)
+        if isinstance(base, faiss.IndexHNSW):
+            base = faiss.downcast_index(base.storage)
+        return base if isinstance(base, faiss.IndexFlat) else None
+    
+    def _map_results(self, D: np.ndarray, I: np.ndarray, top_k: int) -> List[List[Tuple[str, float]]]:
+        """Turn search output over internal IDs into (ID, distance) lists"""
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            # Report squared L2 distance between the unit vectors
+            # (2 - 2 * cosine), as indexes built with IndexFlatL2 did.
+            # float64 keeps the -FLT_MAX padding of short result lists
+            # from overflowing.
+            D = 2.0 - 2.0 * D.astype(np.float64)
+        
+        # Map internal IDs back to external IDs
+        int_to_ext = self._int_to_ext
+        
+        # Convert each result array to Python ints/floats in one call
+        # rather than per element. Padding (-1) and deleted vectors have
+        # no external ID.
+        all_results = []
+        for ids_row, dists_row in zip(I.tolist(), D.tolist()):
+            results = [(ext_id, distance)
+                       for internal_id, distance in zip(ids_row, dists_row)
+                       if (ext_id := int_to_ext.get(internal_id)) is not None]
+            all_results.append(results[:top_k])
+        
+        return all_results
+    
+    def _mark_search_copies_stale(self):
+        """Flag the GPU and sharded copies of the index for a refresh"""
+        self._gpu_stale = True
+        self._shards_stale = True
+        self._live_sel_stale = True
+    
+    def _deleted_positions(self) -> np.ndarray:
+        """Positions in the index of vectors that no longer map to an external ID"""
+        labels = faiss.vector_to_array(self.index.id_map)
+        live_ids = np.fromiter(self.id_mapping.values(), dtype=np.int64, count=len(self.id_mapping))
+        return np.flatnonzero(~np.isin(labels, live_ids))
+    
+    def _live_search_params(self):
+        """SearchParameters that skip deleted vectors, or None if the index holds none"""
+        if self._num_deleted() == 0:
+            return None
+        with self._save_lock:
+            if self._live_sel_stale:
+                deleted_ids = faiss.vector_to_array(self.index.id_map)[self._deleted_positions()]
+                self._live_sel = faiss.IDSelectorNot(faiss.IDSelectorBatch(deleted_ids))
+                self._live_sel_stale = False
+            sel = self._live_sel
+        
+        # IVF indexes only take their own parameter type, which also
+        # overrides nprobe
+        ivf_index = faiss.try_extract_index_ivf(self.index)
+        if ivf_index is not None:
+            return faiss.SearchParametersIVF(sel=sel, nprobe=ivf_index.nprobe)
+        return faiss.SearchParameters(sel=sel)
+    
+    def _get_search_shards(self):
+        """Return the sharded copy of a flat index, refreshing it if stale, or None"""
+        with self._save_lock:
+            if self._shards_stale:
+                self._shards = None
+                self._shard_tiles = []
+                base = faiss.downcast_index(self.index.index)
+                if isinstance(base, faiss.IndexFlat) and self.index.ntotal >= FAISS_SEARCH_SHARDS:
+                    # Split the stored vectors into contiguous tiles, each
+                    # keeping its own internal IDs
+                    labels = faiss.vector_to_array(self.index.id_map)
+                    vectors = base.reconstruct_n(0, self.index.ntotal)
+                    bounds = np.linspace(0, self.index.ntotal, FAISS_SEARCH_SHARDS + 1, dtype=np.int64)
+                    shards = faiss.IndexShards(self.dimension, True, False)
+                    for start, end in zip(bounds[:-1], bounds[1:]):
+                        tile = faiss.IndexIDMap2(faiss.IndexFlat(self.dimension, self.index.metric_type))
+                        tile.add_with_ids(vectors[start:end], labels[start:end])
+                        shards.add_shard(tile)
+                        # IndexShards doesn't own its shards
+                        self._shard_tiles.append(tile)
+                    self._shards = shards
+                self._shards_stale = False
+            return self._shards
+    
+    def _get_gpu_index(self):
+        """Return the GPU copy of the index, refreshing it if stale, or None"""
+        if self._gpu_res is None:
+            return None
+        with self._save_lock:
+            if self._gpu_stale:
+                try:
+                    self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_res, 0, self.index)
+                    self._gpu_stale = False
+                except Exception as e:
+                    # e.g. HNSW, which has no GPU implementation
+                    logger.warning(f"Disabling GPU search, could not copy index to GPU: {e}")
+                    self._gpu_res = None
+                    self._gpu_index = None
+                    return None
+            return self._gpu_index
+    
     def delete_vectors(self, ids: List[str]) -> bool:
         """
         Delete vectors from the index
-        Note: FAISS doesn't natively support removal, so we rebuild the index
+        Note: indexes without native removal (e.g. HNSW) are rebuilt without the deleted vectors
         
         Args:
             ids: List of external IDs to remove
@@ -347,70 +1115,131 @@ class VectorService:
         Returns:
             bool: Success status
         """
+        if self.read_only:
+            logger.error("Cannot delete vectors: vector service is read-only")
+            return False
+        
         try:
-            # For simplicity in implementation, we'll rebuild the index without the deleted vectors
-            # This is inefficient for large indices but works for small to medium sized ones
-            
-            # Get internal IDs to remove
-            internal_ids_to_remove = set()
-            for ext_id in ids:
-                if ext_id in self.id_mapping:
-                    internal_ids_to_remove.add(self.id_mapping[ext_id])
-                    del self.id_mapping[ext_id]
-            
-            if not internal_ids_to_remove:
-                logger.warning("No valid IDs to remove")
-                return False
-            
-            # If we have vectors to keep, rebuild the index
-            if self.id_mapping:
-                # Create a new index
-                new_index = faiss.IndexFlatL2(self.dimension)
+            with self._save_lock:
+                # Get internal IDs to remove
+                removed = {}
+                for ext_id in ids:
+                    if ext_id in self.id_mapping:
+                        internal_id = self.id_mapping.pop(ext_id)
+                        removed[ext_id] = internal_id
+                        del self._int_to_ext[internal_id]
+                internal_ids_to_remove = set(removed.values())
                 
-                # Get all vectors we want to keep
-                reverse_mapping = {v: k for k, v in self.id_mapping.items()}
-                remaining_internal_ids = sorted(list(reverse_mapping.keys()))
-                
-                # This approach only works if we can reconstruct vectors
-                if hasattr(self.index, 'reconstruct'):
-                    # Reconstruct vectors for remaining IDs
-                    vectors_to_keep = []
-                    for idx in remaining_internal_ids:
-                        vector = self.index.reconstruct(int(idx))
-                        vectors_to_keep.append(vector)
-                    
-                    # Add vectors to the new index
-                    vectors_np = np.array(vectors_to_keep).astype('float32')
-                    new_index.add(vectors_np)
-                    
-                    # Update ID mapping to use consecutive indices
-                    new_mapping = {}
-                    for i, internal_id in enumerate(remaining_internal_ids):
-                        ext_id = reverse_mapping[internal_id]
-                        new_mapping[ext_id] = i
-                    
-                    self.id_mapping = new_mapping
-                    self.index = new_index
-                    
-                    # Save changes
-                    self._save_index()
-                    self._save_id_mapping()
-                    
-                    logger.info(f"Removed {len(internal_ids_to_remove)} vectors from index")
-                    return True
-                else:
-                    logger.error("Index doesn't support vector reconstruction, cannot remove vectors")
+                if not internal_ids_to_remove:
+                    logger.warning("No valid IDs to remove")
                     return False
-            else:
-                # If no vectors left, create a new empty index
-                self._create_new_index()
-                self._save_id_mapping()
-                logger.info("Removed all vectors from index")
-                return True
+                
+                try:
+                    self._remove_from_index(internal_ids_to_remove)
+                except Exception:
+                    # Map the IDs again so the mapping still matches the index
+                    self.id_mapping.update(removed)
+                    for ext_id, internal_id in removed.items():
+                        self._int_to_ext[internal_id] = ext_id
+                    raise
+                self._mark_search_copies_stale()
+            
+            self._schedule_save()
+            
+            logger.info(f"Removed {len(internal_ids_to_remove)} vectors from index")
+            return True
         except Exception as e:
             logger.error(f"Error deleting vectors: {e}")
             return False
     
+    def _remove_from_index(self, internal_ids_to_remove):
+        """Remove vectors whose IDs have already been unmapped from the index"""
+        self._ensure_writable()
+        if not self.id_mapping:
+            # If no vectors left, start over with an empty index
+            self.index = self._build_index()
+            self._int_to_ext = {}
+            self._next_internal_id = 0
+        elif self._can_remove_in_place():
+            # Remove in place by ID
+            remove_np = np.fromiter(internal_ids_to_remove, dtype=np.int64, count=len(internal_ids_to_remove))
+            self.index.remove_ids(faiss.IDSelectorBatch(remove_np))
+        elif self._num_deleted() > FAISS_REBUILD_THRESHOLD * self.index.ntotal:
+            # The underlying index can't remove vectors. The deleted vectors
+            # are already unmapped, so search skips them; compact the index
+            # once they make up too large a share of it
+            self._compact_index()
+    
+    def _num_deleted(self) -> int:
+        """Number of vectors in the index that no longer map to an external ID"""
+        return self.index.ntotal - len(self.id_mapping)
+    
+    def _can_remove_in_place(self) -> bool:
+        """Whether IndexIDMap2.remove_ids works on the underlying index"""
+        # IndexIDMap2 assumes removal shifts the remaining vectors down, as
+        # flat storage does. HNSW can't remove at all, and IVF removes
+        # without shifting, which would leave the ID map misaligned.
+        return (isinstance(self.index, faiss.IndexIDMap2)
+                and isinstance(faiss.downcast_index(self.index.index), faiss.IndexFlatCodes))
+    
+    def _compact_index(self):
+        """Rebuild the index with only the vectors that are still mapped"""
+        base = faiss.downcast_index(self.index.index)
+        labels = faiss.vector_to_array(self.index.id_map)
+        live_ids = np.fromiter(self.id_mapping.values(), dtype=np.int64, count=len(self.id_mapping))
+        keep = np.isin(labels, live_ids)
+        if isinstance(base, faiss.IndexIVF):
+            # Drop the deleted codes from the inverted lists instead of
+            # rebuilding: retraining on PQ reconstructions would lose
+            # accuracy with every compaction
+            self._compact_ivf(base, labels, keep)
+            return
+        
+        # Pull all stored vectors in one call and keep the surviving rows
+        all_vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        
+        new_index = self._build_index()
+        new_index.add_with_ids(np.ascontiguousarray(all_vectors[keep]), labels[keep])
+        logger.info(f"Compacted FAISS index from {self.index.ntotal} to {new_index.ntotal} vectors")
+        self.index = new_index
+    
+    def _compact_ivf(self, base, labels: np.ndarray, keep: np.ndarray):
+        """
+        Remove deleted vectors from an IVF index in place, keeping its
+        trained coarse quantizer and PQ codebooks
+        
+        Args:
+            base: The IVF index wrapped by self.index
+            labels: Internal ID of each stored position, from self.index.id_map
+            keep: Which stored positions are still mapped
+        """
+        old_total = self.index.ntotal
+        
+        # IVF removal can't update an array direct map; rebuild it afterwards
+        had_direct_map = base.direct_map.type != faiss.DirectMap.NoMap
+        if had_direct_map:
+            base.set_direct_map_type(faiss.DirectMap.NoMap)
+        base.remove_ids(faiss.IDSelectorBatch(np.flatnonzero(~keep).astype(np.int64)))
+        
+        # The inverted lists store each code under its position in id_map;
+        # renumber the survivors so the positions have no gaps again
+        new_positions = np.cumsum(keep, dtype=np.int64) - 1
+        invlists = base.invlists
+        for list_no in range(base.nlist):
+            size = invlists.list_size(list_no)
+            if size == 0:
+                continue
+            list_ids = new_positions[faiss.rev_swig_ptr(invlists.get_ids(list_no), size)]
+            codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+            invlists.update_entries(list_no, 0, size, faiss.swig_ptr(list_ids), faiss.swig_ptr(codes))
+        if had_direct_map:
+            base.make_direct_map()
+        
+        faiss.copy_array_to_vector(np.ascontiguousarray(labels[keep]), self.index.id_map)
+        self.index.construct_rev_map()
+        self.index.ntotal = base.ntotal
+        logger.info(f"Compacted FAISS index from {old_total} to {self.index.ntotal} vectors")
+    
     def get_stats(self) -> Dict[str, Any]:
         """
         Get stats about the vector index
@@ -419,18 +1248,16 @@ class VectorService:
             Dict with vector database statistics
         """
         try:
-            # Get index size
-            index_size_bytes = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
-            
-            # Format size for display
-            if index_size_bytes < 1024:
-                index_size = f"{index_size_bytes} B"
-            elif index_size_bytes < 1024 * 1024:
-                index_size = f"{index_size_bytes / 1024:.1f} KB"
-            elif index_size_bytes < 1024 * 1024 * 1024:
-                index_size = f"{index_size_bytes / (1024 * 1024):.1f} MB"
-            else:
-                index_size = f"{index_size_bytes / (1024 * 1024 * 1024):.1f} GB"
+            # Get index size, reformatting it only when the file has changed
+            try:
+                st = os.stat(self.index_path)
+                file_key = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                file_key = (None, 0)
+            if self._index_size_cache is None or self._index_size_cache[0] != file_key:
+                self._index_size_cache = (file_key, format_size(file_key[1]))
+            index_size_bytes = file_key[1]
+            index_size = self._index_size_cache[1]
             
             # Get number of vectors
             total_vectors = len(self.id_mapping)
@@ -467,29 +1294,35 @@ class VectorService:
         Returns:
             A list of 12 floats representing the embedding vector
         """
-        dimension = self.dimension  # This should be 12
-        
-        # For consistent results with minimal dependencies, use hash-based embedding
-        import hashlib
-        import numpy as np
-        
-        # Create a hash of the text content
-        text_hash = hashlib.md5(text.encode('utf-8')).hexdigest()
-        
-        # Convert hash to numerical values for seeding
-        seed = int(text_hash, 16) % (2**32)
-        np.random.seed(seed)
-        
-        # Generate a deterministic "embedding" based on the text hash
-        # This ensures the same text always gets the same vector
-        vector = np.random.randn(dimension).astype(np.float32)
-        
-        # Normalize to unit length (for cosine similarity)
-        if np.linalg.norm(vector) > 0:
-            vector = vector / np.linalg.norm(vector)
+        vector = self.generate_embeddings([text])[0]
         
         logger.info(f"Generated embedding with dimension {len(vector)}")
         return vector.tolist()
+    
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate hash-based embeddings for many texts at once
+        
+        Args:
+            texts: The texts to generate embeddings for
+            
+        Returns:
+            A (len(texts), dimension) float32 array of unit-length rows,
+            which can be passed straight to add_vectors
+        """
+        # For consistent results with minimal dependencies, use hash-based embedding
+        # Expand each text into dimension * 4 bytes with SHAKE-256 (an
+        # extendable-output hash; BLAKE2b digests stop at 64 bytes) and read
+        # them as little-endian int32 components, so the same text always
+        # gets the same vector with no random generator involved
+        num_bytes = self.dimension * 4
+        digests = b''.join(hashlib.shake_256(text.encode('utf-8')).digest(num_bytes) for text in texts)
+        out = np.frombuffer(digests, dtype='<i4').reshape(len(texts), self.dimension).astype(np.float32)
+        
+        # Normalize all rows to unit length (for cosine similarity) in place
+        # in one pass
+        faiss.normalize_L2(out)
+        return out
 
 # Singleton instance for the application
 _vector_service = None
@@ -505,11 +1338,37 @@ def get_stats() -> Dict[str, Any]:
     """Get vector database statistics"""
     return get_vector_service().get_stats()
 
+_st_model = None
+
+def _get_st_model():
+    """Get the shared SentenceTransformer model, or None if it is not installed"""
+    global _st_model
+    if _st_model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+            # Use one of the smaller models that's commonly available
+            _st_model = SentenceTransformer('all-MiniLM-L6-v2')
+        except ImportError:
+            logger.warning("SentenceTransformers not available, using feature hashing for embeddings")
+            _st_model = False
+    return _st_model or None
+
+@functools.lru_cache(maxsize=None)
+def _get_hashing_vectorizer(dimension: int) -> HashingVectorizer:
+    """Get a stateless vectorizer hashing words straight to unit-length vectors"""
+    return HashingVectorizer(
+        n_features=dimension,
+        ngram_range=(1, 2),
+        alternate_sign=False,
+        norm='l2',
+        dtype=np.float32
+    )
+
 def generate_embedding(text: str) -> List[float]:
     """
     Generate embeddings for text content using available methods:
     1. Try SentenceTransformers if available (best quality)
-    2. Fall back to TF-IDF + SVD otherwise
+    2. Fall back to feature hashing otherwise
     
     Args:
         text: The text to generate an embedding for
@@ -519,12 +1378,8 @@ def generate_embedding(text: str) -> List[float]:
     """
     dimension = FAISS_DIMENSION
     
-    try:
-        # Try importing sentence_transformers for high-quality embeddings
-        from sentence_transformers import SentenceTransformer
-        
-        # Use one of the smaller models that's commonly available
-        model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = _get_st_model()
+    if model is not None:
         embedding = model.encode(text, normalize_embeddings=True)
         
         # Resize if necessary
@@ -535,62 +1390,15 @@ def generate_embedding(text: str) -> List[float]:
             padding = np.zeros(dimension - len(embedding))
             embedding = np.concatenate([embedding, padding])
             
-        logger.info(f"Generated embedding using SentenceTransformer with dimension {len(embedding)}")
+        logger.debug(f"Generated embedding using SentenceTransformer with dimension {len(embedding)}")
         return embedding.tolist()
     
-    except ImportError:
-        logger.warning("SentenceTransformers not available, using scikit-learn for embeddings")
-        
-        try:
-            # Fall back to TF-IDF + SVD (scikit-learn)
-            from sklearn.feature_extraction.text import TfidfVectorizer
-            from sklearn.decomposition import TruncatedSVD
-            import numpy as np
-            
-            # Create TF-IDF vectorizer
-            vectorizer = TfidfVectorizer(max_features=1000)
-            
-            # Fit and transform the text
-            tfidf_matrix = vectorizer.fit_transform([text])
-            
-            # Reduce dimensionality with SVD
-            svd = TruncatedSVD(n_components=dimension)
-            embedding = svd.fit_transform(tfidf_matrix)[0]
-            
-            # Normalize
-            embedding = embedding / np.linalg.norm(embedding)
-            
-            logger.info(f"Generated embedding using TF-IDF + SVD with dimension {len(embedding)}")
-            return embedding.tolist()
-        
-        except ImportError:
-            logger.warning("Scikit-learn not available, using simple embedding technique")
-            
-            # Basic tokenization and hashing as a last resort
-            import hashlib
-            import numpy as np
-            
-            # Split text into tokens
-            tokens = text.lower().split()
-            
-            # Create an empty embedding vector
-            embedding = np.zeros(dimension, dtype=np.float32)
-            
-            # Fill embedding vector with token hashes
-            for i, token in enumerate(tokens):
-                # Hash the token
-                token_hash = int(hashlib.md5(token.encode('utf-8')).hexdigest(), 16)
-                
-                # Use the hash to set values in the embedding
-                pos = token_hash % dimension
-                embedding[pos] += 1.0 / (i + 1)  # Weigh earlier tokens more
-            
-            # Normalize the vector
-            if np.linalg.norm(embedding) > 0:
-                embedding = embedding / np.linalg.norm(embedding)
-            
-            logger.info(f"Generated embedding using basic hashing with dimension {len(embedding)}")
-            return embedding.tolist()
+    # Fitting TF-IDF + SVD on a single document only ever gives one
+    # meaningful component; hashing needs no fit and is consistent across calls
+    embedding = _get_hashing_vectorizer(dimension).transform([text]).toarray()[0]
+    
+    logger.debug(f"Generated embedding using feature hashing with dimension {len(embedding)}")
+    return embedding.tolist()
 
 # For testing
 if __name__ == "__main__":
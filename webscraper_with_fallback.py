@@ -5,15 +5,18 @@ and fallback mechanisms specifically designed for ClickHouse 18.16.1
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 import json
 import trafilatura
+from trafilatura.settings import use_config
 from urllib3.exceptions import InsecureRequestWarning
+from urllib3.util.retry import Retry
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import ssl
-import time
-import random
+import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Tuple, Optional, Union
 
 # Configure logging
@@ -25,6 +28,24 @@ logger = logging.getLogger(__name__)
 import urllib3
 urllib3.disable_warnings(InsecureRequestWarning)
 
+# Links that don't lead to another page: in-page anchors and non-HTTP schemes
+_SKIP_RE = re.compile(r'(?:#|javascript:|mailto:|tel:)', re.IGNORECASE)
+
+# trafilatura times extraction out with signals, which only work in the main
+# thread. Turning that off per call through a config, rather than by
+# changing trafilatura's module settings, is safe from bulk_extract's
+# worker threads.
+_TRAFILATURA_CONFIG = use_config()
+_TRAFILATURA_CONFIG.set('DEFAULT', 'EXTRACTION_TIMEOUT', '0')
+
+# extract_links reads pages in chunks of this many bytes
+LINK_SCAN_CHUNK_SIZE = 64 * 1024
+
+# Whitespace around line breaks, including any blank lines in between
+_LINE_BREAK_RE = re.compile(r'[^\S\n]*\n\s*')
+# A line followed by one or more copies of itself
+_REPEATED_LINE_RE = re.compile(r'^(.*)(?:\n\1)+$', re.MULTILINE)
+
 class WebScraper:
     """Web scraper with enhanced error handling and SSL workarounds"""
     
@@ -46,6 +67,15 @@ class WebScraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         })
+        
+        # Keep connections to many hosts alive for reuse (bulk_extract runs
+        # up to 20 fetches at once), and retry connection errors and
+        # gateway errors with exponential backoff
+        retry = Retry(total=self.max_retries, backoff_factor=self.retry_delay,
+                      status_forcelist=[502, 503, 504], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=100, pool_maxsize=100, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
         return session
     
     def extract_content(self, url: str, ignore_ssl_errors=True) -> Dict[str, Any]:
@@ -62,114 +92,99 @@ class WebScraper:
         url = url.strip()
         logger.info(f"Extracting content from {url}")
         
-        # Parse domain from URL
-        domain = urlparse(url).netloc
+        # Parse the URL once for the domain and the fallback title
+        parsed_url = urlparse(url)
+        domain = parsed_url.netloc
         
         # Try multiple methods to fetch the content
         content = None
         error = None
+        from_trafilatura = False
         
-        for attempt in range(self.max_retries):
+        try:
+            # Try trafilatura first but with signal handling disabled
+            # This fixes the "Signal only works in main thread" error
+            logger.info("Fetching with trafilatura")
+            
+            # Get the downloaded content
             try:
-                # Try trafilatura first but with signal handling disabled
-                # This fixes the "Signal only works in main thread" error
-                logger.info(f"Attempt {attempt+1}/{self.max_retries} using trafilatura")
-                
-                # Use trafilatura with SIGNAL_TIMEOUT=0 to disable signal handling
-                # Get the downloaded content
+                # First try with fetch_url which is more resilient
+                # Note: trafilatura.fetch_url doesn't accept timeout parameter directly
+                downloaded = trafilatura.fetch_url(url)
+            except Exception as fetch_error:
+                logger.warning(f"trafilatura.fetch_url error: {fetch_error}")
+                # If that fails, try with a simple requests get
+                verify = not ignore_ssl_errors
+                response = self.session.get(url, timeout=self.timeout, verify=verify)
+                response.raise_for_status()
+                downloaded = response.text
+            
+            if downloaded:
                 try:
-                    # First try with fetch_url which is more resilient
-                    # Note: trafilatura.fetch_url doesn't accept timeout parameter directly
-                    downloaded = trafilatura.fetch_url(url)
-                except Exception as fetch_error:
-                    logger.warning(f"trafilatura.fetch_url error: {fetch_error}")
-                    # If that fails, try with a simple requests get
-                    verify = not ignore_ssl_errors
-                    response = self.session.get(url, timeout=self.timeout, verify=verify)
-                    response.raise_for_status()
-                    downloaded = response.text
+                    # Extract with the signal-based timeout disabled
+                    content = trafilatura.extract(downloaded, include_comments=False, include_tables=True, 
+                                                 include_images=True, include_links=True, output_format='txt',
+                                                 deduplicate=True, config=_TRAFILATURA_CONFIG)
+                except Exception as extract_error:
+                    logger.warning(f"trafilatura.extract error: {extract_error}")
+                    content = None
+                
+                if content and len(content.strip()) > 100:  # Consider it successful if we got meaningful content
+                    logger.info(f"Successfully extracted content with trafilatura (length: {len(content)})")
+                    from_trafilatura = True
+        
+        except Exception as e:
+            logger.warning(f"Error with trafilatura: {e}")
+            # Continue to next method
+        
+        if not content or len(content.strip()) < 100:
+            try:
+                # Try with requests as fallback
+                logger.info("Fetching with requests")
+                verify = not ignore_ssl_errors
+                response = self.session.get(url, timeout=self.timeout, verify=verify)
+                response.raise_for_status()
+                
+                # Parse with BeautifulSoup, using the C-based lxml parser
+                # (installed with trafilatura) rather than html.parser
+                soup = BeautifulSoup(response.content, 'lxml')
+                
+                # Extract title
+                title = soup.title.string if soup.title else ""
                 
-                if downloaded:
+                # Extract main content (remove scripts, styles, etc.)
+                for script in soup(["script", "style", "meta", "noscript", "header", "footer", "nav"]):
+                    script.decompose()
+                
+                # Get text content
+                content = soup.get_text(separator='\n', strip=True)
+                
+                if content and len(content.strip()) > 100:
+                    logger.info(f"Successfully extracted content with requests/BeautifulSoup (length: {len(content)})")
+            
+            except requests.exceptions.SSLError:
+                if ignore_ssl_errors:
+                    logger.warning(f"SSL Error with {url}, retrying with SSL verification disabled")
                     try:
-                        # Extract with SIGNAL_TIMEOUT=0 to disable signal handling
-                        import trafilatura.settings
-                        # Store original value
-                        original_timeout = trafilatura.settings.SIGNAL_TIMEOUT
-                        # Disable signal handling
-                        trafilatura.settings.SIGNAL_TIMEOUT = 0
-                        
-                        content = trafilatura.extract(downloaded, include_comments=False, include_tables=True, 
-                                                     include_images=True, include_links=True, output_format='txt')
+                        # Retry with SSL verification disabled
+                        response = self.session.get(url, timeout=self.timeout, verify=False)
+                        response.raise_for_status()
+                        soup = BeautifulSoup(response.content, 'lxml')
+                        content = soup.get_text(separator='\n', strip=True)
                         
-                        # Restore original value
-                        trafilatura.settings.SIGNAL_TIMEOUT = original_timeout
-                    except Exception as extract_error:
-                        logger.warning(f"trafilatura.extract error: {extract_error}")
-                        content = None
-                    
-                    if content and len(content.strip()) > 100:  # Consider it successful if we got meaningful content
-                        logger.info(f"Successfully extracted content with trafilatura (length: {len(content)})")
-                        break
+                        if content and len(content.strip()) > 100:
+                            logger.info(f"Successfully extracted content with SSL verification disabled (length: {len(content)})")
+                    except Exception as e:
+                        logger.warning(f"Error with SSL verification disabled: {e}")
+                        error = str(e)
             
             except Exception as e:
-                logger.warning(f"Error with trafilatura: {e}")
-                # Continue to next method
-            
-            if not content or len(content.strip()) < 100:
-                try:
-                    # Try with requests as fallback
-                    logger.info(f"Attempt {attempt+1}/{self.max_retries} using requests")
-                    verify = not ignore_ssl_errors
-                    response = self.session.get(url, timeout=self.timeout, verify=verify)
-                    response.raise_for_status()
-                    
-                    # Parse with BeautifulSoup
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    
-                    # Extract title
-                    title = soup.title.string if soup.title else ""
-                    
-                    # Extract main content (remove scripts, styles, etc.)
-                    for script in soup(["script", "style", "meta", "noscript", "header", "footer", "nav"]):
-                        script.extract()
-                    
-                    # Get text content
-                    content = soup.get_text(separator='\n', strip=True)
-                    
-                    if content and len(content.strip()) > 100:
-                        logger.info(f"Successfully extracted content with requests/BeautifulSoup (length: {len(content)})")
-                        break
-                
-                except requests.exceptions.SSLError:
-                    if ignore_ssl_errors:
-                        logger.warning(f"SSL Error with {url}, retrying with SSL verification disabled")
-                        try:
-                            # Retry with SSL verification disabled
-                            response = self.session.get(url, timeout=self.timeout, verify=False)
-                            response.raise_for_status()
-                            soup = BeautifulSoup(response.content, 'html.parser')
-                            content = soup.get_text(separator='\n', strip=True)
-                            
-                            if content and len(content.strip()) > 100:
-                                logger.info(f"Successfully extracted content with SSL verification disabled (length: {len(content)})")
-                                break
-                        except Exception as e:
-                            logger.warning(f"Error with SSL verification disabled: {e}")
-                            error = str(e)
-                
-                except Exception as e:
-                    logger.warning(f"Error with requests: {e}")
-                    error = str(e)
-            
-            # If we reached here, the attempt failed. Wait before retrying
-            if attempt < self.max_retries - 1:
-                delay = self.retry_delay * (attempt + 1) + random.uniform(0, 1)
-                logger.info(f"Waiting {delay:.2f} seconds before next attempt...")
-                time.sleep(delay)
+                logger.warning(f"Error with requests: {e}")
+                error = str(e)
         
-        # If all attempts failed, return an error
+        # If all methods failed, return an error
         if not content or len(content.strip()) < 100:
-            logger.error(f"Failed to extract content from {url} after {self.max_retries} attempts")
+            logger.error(f"Failed to extract content from {url}")
             return {
                 'url': url,
                 'success': False,
@@ -180,13 +195,13 @@ class WebScraper:
                 'metadata': {'url': url, 'error': error}
             }
         
-        # Clean up the content a bit
-        content = self._clean_content(content)
+        # Clean up the content a bit; trafilatura output already is
+        content = self._clean_content(content, cleaned=from_trafilatura)
         
         # Extract title from the URL if we don't have it
         if 'title' not in locals() or not title:
             # Try to get title from the last part of the URL path
-            path = urlparse(url).path
+            path = parsed_url.path
             if path and path != '/':
                 title = path.strip('/').split('/')[-1].replace('-', ' ').replace('_', ' ').title()
             else:
@@ -206,25 +221,27 @@ class WebScraper:
             }
         }
     
-    def _clean_content(self, text: str) -> str:
-        """Clean extracted content to improve quality"""
+    def _clean_content(self, text: str, cleaned: bool = False) -> str:
+        """
+        Clean extracted content to improve quality
+        
+        Args:
+            text: Extracted text
+            cleaned: The text is already stripped and deduplicated (as
+                trafilatura output is), so only the size limit applies
+            
+        Returns:
+            Cleaned text
+        """
         if not text:
             return ""
         
-        # Remove excessive whitespace
-        lines = [line.strip() for line in text.split('\n')]
-        lines = [line for line in lines if line]
-        
-        # Remove duplicate lines that often appear in scraped content
-        unique_lines = []
-        prev_line = None
-        for line in lines:
-            if line != prev_line:
-                unique_lines.append(line)
-                prev_line = line
-        
-        # Join back with newlines
-        cleaned_text = '\n'.join(unique_lines)
+        cleaned_text = text
+        if not cleaned:
+            # Strip lines and drop empty ones, then remove duplicate lines
+            # that often appear in scraped content, one regex pass each
+            cleaned_text = _LINE_BREAK_RE.sub('\n', text.strip())
+            cleaned_text = _REPEATED_LINE_RE.sub(r'\1', cleaned_text)
         
         # Limit to a reasonable size (10 MB)
         if len(cleaned_text) > 10 * 1024 * 1024:
@@ -246,30 +263,45 @@ class WebScraper:
         """
         try:
             verify = False  # Ignore SSL errors by default for link extraction
-            response = self.session.get(url, timeout=self.timeout, verify=verify)
-            response.raise_for_status()
+            with self.session.get(url, timeout=self.timeout, verify=verify, stream=True) as response:
+                response.raise_for_status()
+                
+                # Stop downloading once the page has seen plenty of anchor tags
+                # (some are skipped or duplicates) rather than reading it all
+                content = bytearray()
+                anchors = 0
+                for chunk in response.iter_content(LINK_SCAN_CHUNK_SIZE):
+                    content += chunk
+                    anchors += chunk.count(b'<a ') + chunk.count(b'<A ')
+                    if anchors > max_links * 3:
+                        break
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Only build the tree for links, skipping the rest of the page
+            soup = BeautifulSoup(bytes(content), 'lxml', parse_only=SoupStrainer('a', href=True))
             base_url = urlparse(url)
+            base = f"{base_url.scheme}://{base_url.netloc}"
             
             links = []
+            seen = set()
             for link in soup.find_all('a', href=True):
                 href = link['href'].strip()
                 
-                # Skip empty links, anchors, and javascript
-                if not href or href.startswith('#') or href.startswith('javascript:'):
+                # Skip empty links, anchors, javascript, mailto and tel links
+                if not href or _SKIP_RE.match(href):
                     continue
                 
                 # Handle relative URLs
                 if not href.startswith(('http://', 'https://')):
                     if href.startswith('/'):
-                        href = f"{base_url.scheme}://{base_url.netloc}{href}"
+                        href = f"{base}{href}"
                     else:
-                        href = f"{base_url.scheme}://{base_url.netloc}/{href}"
+                        href = f"{base}/{href}"
                 
                 # Add to list if unique
-                if href not in links:
-                    links.append(href)
+                if href in seen:
+                    continue
+                seen.add(href)
+                links.append(href)
                 
                 # Stop when we reach max_links
                 if len(links) >= max_links:
@@ -281,35 +313,41 @@ class WebScraper:
             logger.error(f"Error extracting links from {url}: {e}")
             return []
     
-    def bulk_extract(self, urls: List[str], ignore_ssl_errors=True) -> List[Dict[str, Any]]:
+    def bulk_extract(self, urls: List[str], ignore_ssl_errors=True, max_workers: int = 20) -> List[Dict[str, Any]]:
         """
-        Extract content from multiple URLs
+        Extract content from multiple URLs concurrently
         
         Args:
             urls: List of URLs to scrape
             ignore_ssl_errors: Whether to ignore SSL certificate errors
+            max_workers: Maximum number of URLs fetched at the same time
             
         Returns:
-            List of dictionaries with extracted content and metadata
+            List of dictionaries with extracted content and metadata, in the
+            order of urls
         """
-        results = []
-        for url in urls:
-            try:
-                result = self.extract_content(url, ignore_ssl_errors)
-                results.append(result)
-            except Exception as e:
-                logger.error(f"Error extracting content from {url}: {e}")
-                results.append({
-                    'url': url,
-                    'success': False,
-                    'error': str(e),
-                    'content': None,
-                    'title': None,
-                    'domain': urlparse(url).netloc,
-                    'metadata': {'url': url, 'error': str(e)}
-                })
+        if not urls:
+            return []
         
-        return results
+        # Fetching is network-bound, so threads overlap the waits
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+            return list(executor.map(lambda url: self._extract_one(url, ignore_ssl_errors), urls))
+    
+    def _extract_one(self, url: str, ignore_ssl_errors: bool) -> Dict[str, Any]:
+        """Extract content from one URL for bulk_extract, turning errors into a failed result"""
+        try:
+            return self.extract_content(url, ignore_ssl_errors)
+        except Exception as e:
+            logger.error(f"Error extracting content from {url}: {e}")
+            return {
+                'url': url,
+                'success': False,
+                'error': str(e),
+                'content': None,
+                'title': None,
+                'domain': urlparse(url).netloc,
+                'metadata': {'url': url, 'error': str(e)}
+            }
 
 
 class TextProcessor:
@@ -323,86 +361,28 @@ class TextProcessor:
         Args:
             text: Text to split into chunks
             chunk_size: Maximum size of each chunk
-            chunk_overlap: Overlap between chunks
+            chunk_overlap: Overlap between chunks, smaller than chunk_size
             
         Returns:
             List of text chunks
         """
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        
         if not text:
             return []
         
-        # Clean the text
+        # Clean the text (this collapses it to a single line of words)
         text = TextProcessor.clean_text(text)
         
-        # Split text by paragraphs first
-        paragraphs = text.split('\n')
-        paragraphs = [p for p in paragraphs if p.strip()]
-        
-        chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        for paragraph in paragraphs:
-            # If paragraph is too big, split it into sentences
-            if len(paragraph) > chunk_size:
-                sentences = TextProcessor._split_into_sentences(paragraph)
-                for sentence in sentences:
-                    if current_size + len(sentence) <= chunk_size:
-                        current_chunk.append(sentence)
-                        current_size += len(sentence)
-                    else:
-                        # Current chunk is full, add it to chunks
-                        if current_chunk:
-                            chunks.append(' '.join(current_chunk))
-                        
-                        # Start a new chunk with overlap
-                        overlap_start = max(0, len(current_chunk) - chunk_overlap // len(current_chunk[0]) if current_chunk else 0)
-                        current_chunk = current_chunk[overlap_start:] + [sentence]
-                        current_size = sum(len(s) for s in current_chunk)
-            else:
-                # If adding this paragraph would exceed chunk size, save current chunk and start a new one
-                if current_size + len(paragraph) > chunk_size:
-                    if current_chunk:
-                        chunks.append(' '.join(current_chunk))
-                    
-                    # Start a new chunk with overlap
-                    overlap_start = max(0, len(current_chunk) - chunk_overlap // len(current_chunk[0]) if current_chunk else 0)
-                    current_chunk = current_chunk[overlap_start:] + [paragraph]
-                    current_size = sum(len(s) for s in current_chunk)
-                else:
-                    current_chunk.append(paragraph)
-                    current_size += len(paragraph)
-        
-        # Don't forget the last chunk
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
-        
-        # Handle case where chunks might still be too large
-        final_chunks = []
-        for chunk in chunks:
-            if len(chunk) <= chunk_size:
-                final_chunks.append(chunk)
-            else:
-                # Further split this chunk
-                sub_chunks = TextProcessor._split_chunk(chunk, chunk_size, chunk_overlap // 2)
-                final_chunks.extend(sub_chunks)
-        
-        return final_chunks
-    
-    @staticmethod
-    def _split_into_sentences(text: str) -> List[str]:
-        """Split text into sentences"""
-        # Simple sentence splitting - not perfect but works for most cases
-        # For a more advanced solution, consider using nltk or spacy
-        import re
-        sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s', text)
-        return [s.strip() for s in sentences if s.strip()]
+        return TextProcessor._split_chunk(text, chunk_size, chunk_overlap)
     
     @staticmethod
     def _split_chunk(text: str, max_size: int, overlap: int) -> List[str]:
-        """Split a large chunk into smaller pieces with overlap"""
+        """Split text into pieces of at most max_size characters with overlap,
+        sliding a window over character offsets in a single pass"""
         if len(text) <= max_size:
-            return [text]
+            return [text] if text else []
         
         chunks = []
         start = 0
@@ -418,9 +398,14 @@ class TextProcessor:
                 break_point = end
             
             chunks.append(text[start:break_point])
-            start = break_point - overlap
-            if start < 0:
-                start = 0
+            
+            # Start the overlap at a word boundary where there is one, and
+            # always move forward
+            next_start = break_point - overlap
+            space = text.find(' ', next_start, break_point)
+            if space != -1:
+                next_start = space + 1
+            start = max(start + 1, next_start)
         
         return chunks
     
@@ -430,15 +415,15 @@ class TextProcessor:
         if not text:
             return ""
         
-        # Remove excessive whitespace
+        # Remove excessive whitespace (this also folds newlines into spaces)
         text = ' '.join(text.split())
         
-        # Replace multiple newlines with single newline
-        import re
-        text = re.sub(r'\n+', '\n', text)
-        
-        # Remove unusual characters but keep unicode for international text
-        text = re.sub(r'[^\w\s\p{P}\p{S}\p{M}\n]', '', text, flags=re.UNICODE)
+        # Remove unusual characters but keep unicode for international text.
+        # With whitespace collapsed to single spaces, the only characters
+        # str.isprintable() rejects are control, format, private-use and
+        # unassigned ones, so most text passes the check in one C-level scan.
+        if not text.isprintable():
+            text = ''.join(filter(str.isprintable, text))
         
         return text
 
@@ -1,4 +1,31 @@
+"""
+Socket.IO entry point
+
+With eventlet installed, the app is served from green threads so many
+Socket.IO connections can be open at once. In production run it with a
+single eventlet worker (Socket.IO needs sticky sessions):
+
+    gunicorn -k eventlet -w 1 --bind 0.0.0.0:5000 wsgi:app
+
+Set SOCKETIO_ASYNC_MODE to 'threading' to keep the standard library
+threading server.
+
+This only applies to app.py served through this module. The deployment in
+.replit runs main:app, a separate Flask app without Socket.IO, and is not
+affected.
+"""
 import os
+
+# eventlet has to patch the standard library before anything else imports it
+SOCKETIO_ASYNC_MODE = os.environ.get("SOCKETIO_ASYNC_MODE", "eventlet")
+if SOCKETIO_ASYNC_MODE == "eventlet":
+    try:
+        import eventlet
+        eventlet.monkey_patch()
+    except ImportError:
+        SOCKETIO_ASYNC_MODE = "threading"
+os.environ["SOCKETIO_ASYNC_MODE"] = SOCKETIO_ASYNC_MODE
+
 from app import app, socketio
 
 if __name__ == "__main__":